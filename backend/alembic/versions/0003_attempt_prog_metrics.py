@@ -0,0 +1,22 @@
+"""add per-testcase metrics to attempt_prog
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("attempt_prog", sa.Column("metrics", sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("attempt_prog", "metrics")
@@ -0,0 +1,28 @@
+"""add per-language limits and reference solution to prog_tasks
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("prog_tasks", sa.Column("limits", sa.JSON(), nullable=True))
+    op.add_column("prog_tasks", sa.Column("reference_language", sa.String(length=20), nullable=True))
+    op.add_column("prog_tasks", sa.Column("reference_code", sa.Text(), nullable=True))
+    op.add_column("prog_tasks", sa.Column("calibration", sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("prog_tasks", "calibration")
+    op.drop_column("prog_tasks", "reference_code")
+    op.drop_column("prog_tasks", "reference_language")
+    op.drop_column("prog_tasks", "limits")
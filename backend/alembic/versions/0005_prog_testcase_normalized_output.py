@@ -0,0 +1,45 @@
+"""store normalized expected output and its digest on prog_testcases
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.judge.compare import normalize_output, output_digest
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("prog_testcases", sa.Column("output_normalized", sa.Text(), nullable=True))
+    op.add_column("prog_testcases", sa.Column("output_digest", sa.String(length=64), nullable=True))
+
+    testcases = sa.table(
+        "prog_testcases",
+        sa.column("id", sa.Integer()),
+        sa.column("output_data", sa.Text()),
+        sa.column("output_normalized", sa.Text()),
+        sa.column("output_digest", sa.String()),
+    )
+    conn = op.get_bind()
+    rows = conn.execute(sa.select(testcases.c.id, testcases.c.output_data)).all()
+    for testcase_id, output_data in rows:
+        conn.execute(
+            testcases.update()
+            .where(testcases.c.id == testcase_id)
+            .values(output_normalized=normalize_output(output_data), output_digest=output_digest(output_data))
+        )
+
+    op.alter_column("prog_testcases", "output_normalized", nullable=False)
+    op.alter_column("prog_testcases", "output_digest", nullable=False)
+
+
+def downgrade() -> None:
+    op.drop_column("prog_testcases", "output_digest")
+    op.drop_column("prog_testcases", "output_normalized")
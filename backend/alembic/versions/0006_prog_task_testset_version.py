@@ -0,0 +1,49 @@
+"""add testset_version to prog_tasks, bumped by a trigger on prog_testcases
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "prog_tasks",
+        sa.Column("testset_version", sa.Integer(), nullable=False, server_default="1"),
+    )
+    op.execute(
+        """
+        CREATE FUNCTION bump_testset_version() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                UPDATE prog_tasks SET testset_version = testset_version + 1 WHERE id = OLD.task_id;
+            END IF;
+            IF TG_OP <> 'DELETE' AND (TG_OP = 'INSERT' OR NEW.task_id <> OLD.task_id) THEN
+                UPDATE prog_tasks SET testset_version = testset_version + 1 WHERE id = NEW.task_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER prog_testcases_bump_testset_version
+        AFTER INSERT OR DELETE OR UPDATE OF task_id, input_data, output_data ON prog_testcases
+        FOR EACH ROW EXECUTE FUNCTION bump_testset_version()
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER prog_testcases_bump_testset_version ON prog_testcases")
+    op.execute("DROP FUNCTION bump_testset_version()")
+    op.drop_column("prog_tasks", "testset_version")
@@ -0,0 +1,21 @@
+"""index exam_attempts by (status, ends_at) for the auto-submit sweep
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_exam_attempts_status_ends_at", "exam_attempts", ["status", "ends_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_exam_attempts_status_ends_at", table_name="exam_attempts")
@@ -0,0 +1,33 @@
+"""track which testcase versions each verdict was judged against, for incremental regrades
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("prog_testcases", sa.Column("input_digest", sa.String(length=64), nullable=True))
+    op.execute("UPDATE prog_testcases SET input_digest = encode(sha256(convert_to(input_data, 'UTF8')), 'hex')")
+    op.alter_column("prog_testcases", "input_digest", nullable=False)
+
+    # NULL for drafts judged before this revision: a regrade re-runs them in full.
+    op.add_column("attempt_prog", sa.Column("judged_tests", sa.JSON(), nullable=True))
+
+    op.create_index("ix_attempt_answers_question_id", "attempt_answers", ["question_id"])
+    op.create_index("ix_attempt_prog_task_id", "attempt_prog", ["task_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_attempt_prog_task_id", table_name="attempt_prog")
+    op.drop_index("ix_attempt_answers_question_id", table_name="attempt_answers")
+    op.drop_column("attempt_prog", "judged_tests")
+    op.drop_column("prog_testcases", "input_digest")
@@ -0,0 +1,50 @@
+"""unique and lookup indexes for the attempt hot paths
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Racing requests could create duplicates while nothing enforced uniqueness. Keep the
+    # first attempt per user (its children cascade), and the latest answer/draft per slot.
+    op.execute(
+        """
+        DELETE FROM exam_attempts a USING exam_attempts b
+        WHERE a.user_id = b.user_id AND a.id > b.id
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM attempt_answers a USING attempt_answers b
+        WHERE a.attempt_id = b.attempt_id AND a.question_id = b.question_id AND a.id < b.id
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM attempt_prog a USING attempt_prog b
+        WHERE a.attempt_id = b.attempt_id AND a.task_id = b.task_id AND a.id < b.id
+        """
+    )
+
+    op.create_index("ix_exam_attempts_user_id", "exam_attempts", ["user_id"], unique=True)
+    op.create_index(
+        "ix_attempt_answers_attempt_question", "attempt_answers", ["attempt_id", "question_id"], unique=True
+    )
+    op.create_index("ix_attempt_prog_attempt_task", "attempt_prog", ["attempt_id", "task_id"], unique=True)
+    op.create_index("ix_prog_testcases_task_id", "prog_testcases", ["task_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_prog_testcases_task_id", table_name="prog_testcases")
+    op.drop_index("ix_attempt_prog_attempt_task", table_name="attempt_prog")
+    op.drop_index("ix_attempt_answers_attempt_question", table_name="attempt_answers")
+    op.drop_index("ix_exam_attempts_user_id", table_name="exam_attempts")
@@ -0,0 +1,23 @@
+"""version counter on attempt_prog for optimistic, patch-based draft sync
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("attempt_prog", sa.Column("version", sa.Integer(), nullable=False, server_default="0"))
+    op.execute("UPDATE attempt_prog SET version = 1 WHERE code IS NOT NULL")
+
+
+def downgrade() -> None:
+    op.drop_column("attempt_prog", "version")
@@ -0,0 +1,26 @@
+"""revision counters for conditional and incremental exam state
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0011"
+down_revision = "0010"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for table in ("exam_attempts", "attempt_answers", "attempt_prog"):
+        op.add_column(table, sa.Column("revision", sa.Integer(), nullable=False, server_default="0"))
+        # Existing rows count as revision 1, so a client asking for changes since 0 still gets them.
+        op.execute(f"UPDATE {table} SET revision = 1")
+
+
+def downgrade() -> None:
+    for table in ("attempt_prog", "attempt_answers", "exam_attempts"):
+        op.drop_column(table, "revision")
@@ -1,12 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.api.catalog import catalog_cache
 from app.api.deps import get_admin_user
 from app.db.session import get_session
 from app.models import Question, ProgTask, ProgTestcase, ExamAttempt, AttemptAnswer, AttemptProg, User
 from app.schemas.question import QuestionIn, QuestionOut
 from app.schemas.prog import ProgTaskIn, ProgTaskOut, ProgTestcaseIn, ProgTestcaseOut
+from app.core.redis import get_redis
+from app.judge.admission import host_report
+from app.worker.celery_app import GRADING_QUEUE, JUDGE_QUEUE, celery_app
+from app.worker import regrade
+from app.worker.scheduling import CALIBRATION_PRIORITY, REGRADE_PRIORITY, queue_report
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -22,6 +29,7 @@ async def create_question(data: QuestionIn, session: AsyncSession = Depends(get_
     q = Question(**data.model_dump())
     session.add(q)
     await session.commit()
+    await catalog_cache.invalidate()
     await session.refresh(q)
     return q
 
@@ -35,6 +43,7 @@ async def update_question(question_id: int, data: QuestionIn, session: AsyncSess
     for k, v in data.model_dump().items():
         setattr(q, k, v)
     await session.commit()
+    await catalog_cache.invalidate()
     await session.refresh(q)
     return q
 
@@ -47,6 +56,7 @@ async def delete_question(question_id: int, session: AsyncSession = Depends(get_
         raise HTTPException(status_code=404, detail="Not found")
     await session.delete(q)
     await session.commit()
+    await catalog_cache.invalidate()
     return {"status": "deleted"}
 
 
@@ -61,6 +71,7 @@ async def create_task(data: ProgTaskIn, session: AsyncSession = Depends(get_sess
     t = ProgTask(**data.model_dump())
     session.add(t)
     await session.commit()
+    await catalog_cache.invalidate()
     await session.refresh(t)
     return t
 
@@ -74,6 +85,7 @@ async def update_task(task_id: int, data: ProgTaskIn, session: AsyncSession = De
     for k, v in data.model_dump().items():
         setattr(t, k, v)
     await session.commit()
+    await catalog_cache.invalidate()
     await session.refresh(t)
     return t
 
@@ -86,9 +98,25 @@ async def delete_task(task_id: int, session: AsyncSession = Depends(get_session)
         raise HTTPException(status_code=404, detail="Not found")
     await session.delete(t)
     await session.commit()
+    await catalog_cache.invalidate()
     return {"status": "deleted"}
 
 
+@router.post("/prog_tasks/{task_id}/calibrate", response_model=ProgTaskOut)
+async def calibrate_task(task_id: int, session: AsyncSession = Depends(get_session), _: str = Depends(get_admin_user)):
+    res = await session.execute(select(ProgTask).where(ProgTask.id == task_id))
+    t = res.scalar_one_or_none()
+    if not t:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not t.reference_language or not t.reference_code:
+        raise HTTPException(status_code=400, detail="Reference solution is not set")
+    t.calibration = {"status": "queued"}
+    await session.commit()
+    await session.refresh(t)
+    celery_app.send_task("calibrate_task", args=[t.id], priority=CALIBRATION_PRIORITY)
+    return t
+
+
 @router.get("/prog_testcases", response_model=list[ProgTestcaseOut])
 async def list_testcases(session: AsyncSession = Depends(get_session), _: str = Depends(get_admin_user)):
     res = await session.execute(select(ProgTestcase))
@@ -140,9 +168,32 @@ async def publish_entity(entity: str, entity_id: int, session: AsyncSession = De
         raise HTTPException(status_code=404, detail="Not found")
     obj.published = not obj.published
     await session.commit()
+    await catalog_cache.invalidate()
     return {"id": obj.id, "published": obj.published}
 
 
+@router.post("/regrade/{entity}/{entity_id}")
+async def start_regrade(entity: str, entity_id: int, session: AsyncSession = Depends(get_session), _: str = Depends(get_admin_user)):
+    model_map = {"questions": (Question, "regrade_question"), "prog_tasks": (ProgTask, "regrade_prog_task")}
+    if entity not in model_map:
+        raise HTTPException(status_code=400, detail="Invalid entity")
+    model, task_name = model_map[entity]
+    res = await session.execute(select(model.id).where(model.id == entity_id))
+    if res.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    job_id = await run_in_threadpool(regrade.create_job, entity, entity_id)
+    celery_app.send_task(task_name, args=[job_id, entity_id], priority=REGRADE_PRIORITY)
+    return {"job_id": job_id}
+
+
+@router.get("/regrade/{job_id}")
+def regrade_progress(job_id: str, _: str = Depends(get_admin_user)):
+    job = regrade.progress(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Not found")
+    return job
+
+
 @router.get("/stats")
 async def stats(session: AsyncSession = Depends(get_session), _: str = Depends(get_admin_user)):
     total_attempts = (await session.execute(select(func.count(ExamAttempt.id)))).scalar() or 0
@@ -163,6 +214,15 @@ async def stats(session: AsyncSession = Depends(get_session), _: str = Depends(g
     }
 
 
+@router.get("/queues")
+def queues(_: str = Depends(get_admin_user)):
+    client = get_redis()
+    return {
+        "queues": queue_report(client, [GRADING_QUEUE, JUDGE_QUEUE]),
+        "hosts": host_report(client),
+    }
+
+
 @router.get("/attempts")
 async def attempts(session: AsyncSession = Depends(get_session), _: str = Depends(get_admin_user)):
     res = await session.execute(
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import logging
+
+import redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.events import listen
+from app.core.redis import get_async_redis
+from app.models import ProgTask, Question
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "exam:catalog:version"
+CHANNEL = "exam:catalog"
+
+
+async def _load(session: AsyncSession) -> bytes:
+    res_q = await session.execute(select(Question).where(Question.published.is_(True)).order_by(Question.id))
+    res_t = await session.execute(select(ProgTask).where(ProgTask.published.is_(True)).order_by(ProgTask.id))
+    questions = res_q.scalars().all()
+    catalog = {
+        "math_questions": [
+            {"id": q.id, "question": q.question, "options": q.options, "points": q.points}
+            for q in questions
+            if q.subject == "math"
+        ],
+        "ru_questions": [
+            {"id": q.id, "question": q.question, "options": q.options, "points": q.points}
+            for q in questions
+            if q.subject == "ru"
+        ],
+        "prog_tasks": [
+            {"id": t.id, "title": t.title, "statement": t.statement, "points": t.points}
+            for t in res_t.scalars().all()
+        ],
+    }
+    # Object members without the braces, ready to be spliced into a response body.
+    return json.dumps(catalog, ensure_ascii=False).encode("utf-8")[1:-1]
+
+
+class CatalogCache:
+    """Published questions and tasks, serialized once per catalog version in each API process."""
+
+    def __init__(self):
+        self._fragment: bytes | None = None
+        self._version: int | None = None
+        self._stale = True
+        self._lock = asyncio.Lock()
+        self._listener: asyncio.Task | None = None
+
+    async def get(self, session: AsyncSession) -> tuple[int | None, bytes]:
+        """The catalog version and fragment; the version is None when Redis is unavailable."""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(listen(CHANNEL, self._on_version, self._mark_stale))
+        if not self._stale:
+            return self._version, self._fragment
+        async with self._lock:
+            if not self._stale:
+                return self._version, self._fragment
+            try:
+                version = int(await get_async_redis().get(VERSION_KEY) or 0)
+            except redis.RedisError:
+                logger.warning("Catalog version unavailable, serving uncached", exc_info=True)
+                return None, await _load(session)
+            # Cleared before loading: an invalidation that lands mid-load marks the result stale again.
+            self._stale = False
+            self._fragment = await _load(session)
+            self._version = version
+            return version, self._fragment
+
+    async def invalidate(self) -> None:
+        self._stale = True
+        try:
+            client = get_async_redis()
+            await client.publish(CHANNEL, await client.incr(VERSION_KEY))
+        except redis.RedisError:
+            logger.warning("Failed to broadcast catalog invalidation", exc_info=True)
+
+    def _on_version(self, data: bytes) -> None:
+        if int(data) != self._version:
+            self._stale = True
+
+    def _mark_stale(self) -> None:
+        self._stale = True
+
+
+catalog_cache = CatalogCache()
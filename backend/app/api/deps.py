@@ -11,10 +11,7 @@ from app.models.user import User
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    session: AsyncSession = Depends(get_session),
-) -> User:
+async def user_from_token(token: str, session: AsyncSession) -> User:
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=["HS256"])
         user_id: str | None = payload.get("sub")
@@ -29,6 +26,13 @@ async def get_current_user(
     return user
 
 
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    session: AsyncSession = Depends(get_session),
+) -> User:
+    return await user_from_token(token, session)
+
+
 async def get_admin_user(current: User = Depends(get_current_user)) -> User:
     if not current.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
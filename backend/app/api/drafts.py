@@ -0,0 +1,96 @@
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api import revisions
+from app.core import autosave
+from app.core.config import settings
+from app.models import AttemptProg, ExamAttempt
+from app.schemas.exam import DraftEdit, DraftIn
+
+# A compare-and-set can lose to a concurrent flush of the same draft; that is retried, not reported.
+SAVE_ATTEMPTS = 3
+EMPTY_DRAFT = {"language": None, "code": None, "version": 0}
+
+
+class DraftConflict(Exception):
+    def __init__(self, current: dict):
+        super().__init__("Draft changed since base_version")
+        self.current = current
+
+
+def apply_edits(code: str, edits: list[DraftEdit]) -> str:
+    """Apply non-overlapping edits, all relative to the base text, counting UTF-16 code units."""
+    units = code.encode("utf-16-le")
+    position = len(units) // 2
+    for edit in sorted(edits, key=lambda e: e.start, reverse=True):
+        if not 0 <= edit.start <= edit.end <= position:
+            raise ValueError("Edit out of range or overlapping")
+        units = units[:edit.start * 2] + edit.text.encode("utf-16-le") + units[edit.end * 2:]
+        position = edit.start
+    try:
+        return units.decode("utf-16-le")
+    except UnicodeDecodeError:
+        raise ValueError("Edit splits a character") from None
+
+
+def _next(current: dict, data: DraftIn) -> dict:
+    version = current.get("version", 0)
+    if data.base_version is not None and data.base_version != version:
+        raise DraftConflict(current)
+    code = data.code if data.edits is None else apply_edits(current["code"] or "", data.edits)
+    return {"language": data.language, "code": code, "version": version + 1}
+
+
+async def _stored(session: AsyncSession, attempt_id: int, task_id: int) -> dict | None:
+    res = await session.execute(
+        select(AttemptProg.language, AttemptProg.code, AttemptProg.version).where(
+            AttemptProg.attempt_id == attempt_id, AttemptProg.task_id == task_id
+        )
+    )
+    row = res.one_or_none()
+    return dict(row._mapping) if row else None
+
+
+async def _save_buffered(session: AsyncSession, attempt: ExamAttempt, task_id: int, data: DraftIn) -> int:
+    for _ in range(SAVE_ATTEMPTS):
+        raw, current = await autosave.buffered_draft(attempt.id, task_id)
+        if current is None:
+            current = await _stored(session, attempt.id, task_id) or EMPTY_DRAFT
+        draft = _next(current, data)
+        if await autosave.replace_draft(attempt.id, task_id, raw, draft, attempt.revision):
+            return draft["version"]
+    raise DraftConflict(current)
+
+
+async def _save_stored(session: AsyncSession, attempt: ExamAttempt, task_id: int, data: DraftIn) -> int:
+    for _ in range(SAVE_ATTEMPTS):
+        # Bumped first: the attempt row lock then serializes concurrent saves of the same attempt.
+        revision = await revisions.bump(session, attempt.id)
+        current = await _stored(session, attempt.id, task_id)
+        draft = {**_next(current or EMPTY_DRAFT, data), "revision": revision}
+        if current is None:
+            stmt = (
+                insert(AttemptProg)
+                .values(attempt_id=attempt.id, task_id=task_id, **draft)
+                .on_conflict_do_nothing(index_elements=["attempt_id", "task_id"])
+            )
+        else:
+            stmt = update(AttemptProg).where(
+                AttemptProg.attempt_id == attempt.id,
+                AttemptProg.task_id == task_id,
+                AttemptProg.version == current["version"],
+            ).values(**draft)
+        res = await session.execute(stmt.returning(AttemptProg.version))
+        version = res.scalar_one_or_none()
+        await session.commit()
+        if version is not None:
+            return version
+    raise DraftConflict(await _stored(session, attempt.id, task_id))
+
+
+async def save(session: AsyncSession, attempt: ExamAttempt, task_id: int, data: DraftIn) -> int:
+    """Store a full or patched draft and return its new version; a stale base_version raises DraftConflict."""
+    if settings.autosave_write_behind:
+        return await _save_buffered(session, attempt, task_id, data)
+    return await _save_stored(session, attempt, task_id, data)
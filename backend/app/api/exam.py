@@ -1,88 +1,163 @@
+import asyncio
 from datetime import datetime, timedelta, timezone
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.deps import get_current_user
-from app.db.session import get_session
-from app.models import Question, ProgTask, ExamAttempt, AttemptAnswer, AttemptProg
-from app.schemas.exam import AnswerIn, DraftIn, ExamStateOut, ExamResultOut
+from app.api import drafts as draft_sync
+from app.api import revisions
+from app.api.catalog import catalog_cache
+from app.api.deps import get_current_user, user_from_token
+from app.core import autosave
+from app.core.config import settings
+from app.core.events import event_hub, format_sse
+from app.db.session import AsyncSessionLocal, get_session
+from app.db.upsert import upsert
+from app.models import ExamAttempt, AttemptAnswer, AttemptProg
+from app.schemas.exam import AnswerIn, DraftIn, AttemptStateOut, ExamStateOut, ExamResultOut
 from app.worker.celery_app import celery_app
+from app.worker.scheduling import grading_priority
 
 router = APIRouter(prefix="/exam", tags=["exam"])
 
+SCORE_BLOCKS = ("math", "ru", "prog")
+
 
 async def _get_attempt(session: AsyncSession, user_id: int) -> ExamAttempt | None:
     result = await session.execute(select(ExamAttempt).where(ExamAttempt.user_id == user_id))
     return result.scalar_one_or_none()
 
 
+async def _time_out_attempt(session: AsyncSession, attempt: ExamAttempt, now: datetime) -> None:
+    res = await session.execute(
+        update(ExamAttempt)
+        .where(ExamAttempt.id == attempt.id, ExamAttempt.status == "in_progress")
+        .values(status="timed_out", submitted_at=now)
+        .returning(ExamAttempt.id)
+    )
+    claimed = res.scalar_one_or_none()
+    await session.commit()
+    await session.refresh(attempt)
+    if claimed:
+        celery_app.send_task("grade_attempt", args=[attempt.id], priority=grading_priority("timed_out"))
+
+
 @router.post("/start", response_model=ExamStateOut)
 async def start_exam(current=Depends(get_current_user), session: AsyncSession = Depends(get_session)):
-    existing = await _get_attempt(session, current.id)
-    if existing:
-        raise HTTPException(status_code=400, detail="Attempt already exists")
-
     now = datetime.now(timezone.utc)
     ends_at = now + timedelta(minutes=60)
-    attempt = ExamAttempt(user_id=current.id, started_at=now, ends_at=ends_at, status="in_progress")
-    session.add(attempt)
+    res = await session.execute(
+        insert(ExamAttempt)
+        .values(user_id=current.id, started_at=now, ends_at=ends_at, status="in_progress")
+        .on_conflict_do_nothing(index_elements=["user_id"])
+        .returning(ExamAttempt.id)
+    )
+    attempt_id = res.scalar_one_or_none()
+    if attempt_id is None:
+        raise HTTPException(status_code=400, detail="Attempt already exists")
     await session.commit()
-    await session.refresh(attempt)
+    celery_app.send_task("close_attempt", args=[attempt_id], eta=ends_at)
+
+    return await get_state(current, session, if_none_match=None)
+
+
+def _parse_versions(draft_versions: str | None) -> dict[str, int]:
+    if not draft_versions:
+        return {}
+    try:
+        return {
+            task_id: int(version)
+            for task_id, version in (item.split(":") for item in draft_versions.split(","))
+        }
+    except ValueError:
+        raise HTTPException(status_code=422, detail="draft_versions must look like task_id:version,...")
+
 
-    return await get_state(current, session)
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+def _newer(entries: dict, key: int, value: dict) -> None:
+    if value.get("revision", 0) >= entries.get(key, {}).get("revision", 0):
+        entries[key] = value
 
 
 @router.get("/state", response_model=ExamStateOut)
-async def get_state(current=Depends(get_current_user), session: AsyncSession = Depends(get_session)):
+async def get_state(
+    current=Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+    draft_versions: str | None = None,
+    since: int | None = None,
+    catalog_version: int | None = None,
+    if_none_match: str | None = Header(default=None),
+):
+    known_versions = _parse_versions(draft_versions)
     attempt = await _get_attempt(session, current.id)
     if not attempt:
         raise HTTPException(status_code=404, detail="Attempt not found")
     now = datetime.now(timezone.utc)
     if attempt.status == "in_progress" and now >= attempt.ends_at:
-        attempt.status = "timed_out"
-        attempt.submitted_at = now
-        await session.commit()
-        celery_app.send_task("grade_attempt", args=[attempt.id])
-
-    result_math = await session.execute(select(Question).where(Question.subject == "math", Question.published.is_(True)))
-    result_ru = await session.execute(select(Question).where(Question.subject == "ru", Question.published.is_(True)))
-    result_prog = await session.execute(select(ProgTask).where(ProgTask.published.is_(True)))
-
-    math_questions = [
-        {"id": q.id, "question": q.question, "options": q.options, "points": q.points}
-        for q in result_math.scalars().all()
-    ]
-    ru_questions = [
-        {"id": q.id, "question": q.question, "options": q.options, "points": q.points}
-        for q in result_ru.scalars().all()
-    ]
-    prog_tasks = [
-        {"id": t.id, "title": t.title, "statement": t.statement, "points": t.points}
-        for t in result_prog.scalars().all()
-    ]
+        await _time_out_attempt(session, attempt, now)
+
+    current_catalog, catalog = await catalog_cache.get(session)
+    revision = await revisions.current(attempt)
+    headers = {"Cache-Control": "private, no-cache"}
+    if current_catalog is not None:
+        headers["ETag"] = f'"{attempt.id}.{revision}.{attempt.status}.{current_catalog}"'
+        if _etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+    # Read before the database: an entry flushed in between is then found there rather than missed.
+    buffered_answers, buffered_drafts = {}, {}
+    if settings.autosave_write_behind:
+        buffered_answers, buffered_drafts = await autosave.buffered(attempt.id)
 
     answers = {}
-    res_ans = await session.execute(select(AttemptAnswer).where(AttemptAnswer.attempt_id == attempt.id))
-    for a in res_ans.scalars().all():
-        answers[str(a.question_id)] = a.selected_index
+    query = select(AttemptAnswer).where(AttemptAnswer.attempt_id == attempt.id)
+    if since is not None:
+        query = query.where(AttemptAnswer.revision > since)
+    for a in (await session.execute(query)).scalars().all():
+        answers[a.question_id] = {"selected_index": a.selected_index, "revision": a.revision}
 
     drafts = {}
-    res_prog = await session.execute(select(AttemptProg).where(AttemptProg.attempt_id == attempt.id))
-    for d in res_prog.scalars().all():
-        drafts[str(d.task_id)] = {"language": d.language, "code": d.code}
-
-    return ExamStateOut(
+    query = select(AttemptProg).where(AttemptProg.attempt_id == attempt.id)
+    if since is not None:
+        query = query.where(AttemptProg.revision > since)
+    for d in (await session.execute(query)).scalars().all():
+        drafts[d.task_id] = {"language": d.language, "code": d.code, "version": d.version, "revision": d.revision}
+
+    # Saves not flushed yet are usually newer than the database; revisions settle the rest.
+    for question_id, value in buffered_answers.items():
+        if since is None or value["revision"] > since:
+            _newer(answers, question_id, value)
+    for task_id, value in buffered_drafts.items():
+        if since is None or value.get("revision", 0) > since:
+            _newer(drafts, task_id, value)
+
+    state = AttemptStateOut(
         attempt_id=attempt.id,
         status=attempt.status,
         started_at=attempt.started_at,
         ends_at=attempt.ends_at,
-        math_questions=math_questions,
-        ru_questions=ru_questions,
-        prog_tasks=prog_tasks,
-        answers=answers,
-        drafts=drafts,
-    )
+        revision=revision,
+        catalog_version=current_catalog,
+        answers={str(question_id): value["selected_index"] for question_id, value in answers.items()},
+        # Drafts the client already holds at the same version are left out.
+        drafts={
+            str(task_id): {"language": draft["language"], "code": draft["code"], "version": draft.get("version", 0)}
+            for task_id, draft in drafts.items()
+            if known_versions.get(str(task_id)) != draft.get("version", 0)
+        },
+    ).model_dump_json().encode("utf-8")
+    if catalog_version is not None and catalog_version == current_catalog:
+        return Response(state, media_type="application/json", headers=headers)
+    # The catalog part is shared by every student and arrives already serialized.
+    return Response(state[:-1] + b"," + catalog + b"}", media_type="application/json", headers=headers)
 
 
 async def _check_attempt_open(session: AsyncSession, attempt: ExamAttempt):
@@ -90,10 +165,7 @@ async def _check_attempt_open(session: AsyncSession, attempt: ExamAttempt):
     if attempt.status != "in_progress":
         raise HTTPException(status_code=400, detail="Attempt is closed")
     if now >= attempt.ends_at:
-        attempt.status = "timed_out"
-        attempt.submitted_at = now
-        await session.commit()
-        celery_app.send_task("grade_attempt", args=[attempt.id])
+        await _time_out_attempt(session, attempt, now)
         raise HTTPException(status_code=400, detail="Attempt time is over")
 
 
@@ -108,18 +180,24 @@ async def save_answer(
     if not attempt:
         raise HTTPException(status_code=404, detail="Attempt not found")
     await _check_attempt_open(session, attempt)
-
-    res = await session.execute(
-        select(AttemptAnswer).where(
-            AttemptAnswer.attempt_id == attempt.id, AttemptAnswer.question_id == question_id
+    if settings.autosave_write_behind:
+        await autosave.buffer_answer(attempt.id, question_id, data.selected_index, attempt.revision)
+        return {"status": "ok"}
+
+    revision = await revisions.bump(session, attempt.id)
+    await session.execute(
+        upsert(
+            AttemptAnswer,
+            {
+                "attempt_id": attempt.id,
+                "question_id": question_id,
+                "selected_index": data.selected_index,
+                "revision": revision,
+            },
+            ["attempt_id", "question_id"],
+            ["selected_index", "revision"],
         )
     )
-    ans = res.scalar_one_or_none()
-    if not ans:
-        ans = AttemptAnswer(attempt_id=attempt.id, question_id=question_id, selected_index=data.selected_index)
-        session.add(ans)
-    else:
-        ans.selected_index = data.selected_index
     await session.commit()
     return {"status": "ok"}
 
@@ -135,19 +213,13 @@ async def save_draft(
     if not attempt:
         raise HTTPException(status_code=404, detail="Attempt not found")
     await _check_attempt_open(session, attempt)
-
-    res = await session.execute(
-        select(AttemptProg).where(AttemptProg.attempt_id == attempt.id, AttemptProg.task_id == task_id)
-    )
-    draft = res.scalar_one_or_none()
-    if not draft:
-        draft = AttemptProg(attempt_id=attempt.id, task_id=task_id, language=data.language, code=data.code)
-        session.add(draft)
-    else:
-        draft.language = data.language
-        draft.code = data.code
-    await session.commit()
-    return {"status": "ok"}
+    try:
+        version = await draft_sync.save(session, attempt, task_id, data)
+    except draft_sync.DraftConflict as exc:
+        raise HTTPException(status_code=409, detail={"draft": exc.current})
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    return {"status": "ok", "version": version}
 
 
 @router.post("/submit")
@@ -162,7 +234,7 @@ async def submit_exam(current=Depends(get_current_user), session: AsyncSession =
     attempt.submitted_at = datetime.now(timezone.utc)
     await session.commit()
 
-    celery_app.send_task("grade_attempt", args=[attempt.id])
+    celery_app.send_task("grade_attempt", args=[attempt.id], priority=grading_priority("submitted"))
     return {"status": "submitted"}
 
 
@@ -182,13 +254,57 @@ async def get_result(current=Depends(get_current_user), session: AsyncSession =
     per_task = {}
     res_prog = await session.execute(select(AttemptProg).where(AttemptProg.attempt_id == attempt.id))
     for d in res_prog.scalars().all():
-        per_task[str(d.task_id)] = bool(d.is_correct)
+        per_task[str(d.task_id)] = d.is_correct
 
+    score_blocks = attempt.score_blocks or {}
     return ExamResultOut(
         attempt_id=attempt.id,
         status=attempt.status,
         score_total=attempt.score_total or 0,
-        score_blocks=attempt.score_blocks or {},
+        score_blocks=score_blocks,
         per_question=per_question,
         per_task=per_task,
+        pending_blocks=[block for block in SCORE_BLOCKS if block not in score_blocks],
+    )
+
+
+async def _graded_event(attempt_id: int) -> dict | None:
+    async with AsyncSessionLocal() as session:
+        res = await session.execute(
+            select(ExamAttempt.score_total, ExamAttempt.score_blocks).where(ExamAttempt.id == attempt_id)
+        )
+        score_total, score_blocks = res.one()
+    if all(block in (score_blocks or {}) for block in SCORE_BLOCKS):
+        return {"attempt_id": attempt_id, "event": "graded", "score_total": score_total}
+    return None
+
+
+async def _event_stream(attempt_id: int):
+    async with event_hub.subscribe(attempt_id) as queue:
+        # Checked after subscribing, so grading that finishes in between is not missed.
+        payload = await _graded_event(attempt_id)
+        while payload is None or payload["event"] != "graded":
+            if payload is not None:
+                yield format_sse(payload)
+            try:
+                payload = await asyncio.wait_for(queue.get(), settings.events_heartbeat_seconds)
+            except asyncio.TimeoutError:
+                payload = None
+                yield ": ping\n\n"
+        yield format_sse(payload)
+
+
+@router.get("/events")
+async def events(token: str):
+    # EventSource cannot send an Authorization header, hence the token in the query string.
+    # No request-scoped session either: it would hold a DB connection for the whole stream.
+    async with AsyncSessionLocal() as session:
+        current = await user_from_token(token, session)
+        attempt = await _get_attempt(session, current.id)
+    if not attempt:
+        raise HTTPException(status_code=404, detail="Attempt not found")
+    return StreamingResponse(
+        _event_stream(attempt.id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
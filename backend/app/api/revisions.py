@@ -0,0 +1,24 @@
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import autosave
+from app.core.config import settings
+from app.models import ExamAttempt
+
+
+async def bump(session: AsyncSession, attempt_id: int) -> int:
+    """Next revision of a save written straight to the database, in the caller's transaction."""
+    res = await session.execute(
+        update(ExamAttempt)
+        .where(ExamAttempt.id == attempt_id)
+        .values(revision=ExamAttempt.revision + 1)
+        .returning(ExamAttempt.revision)
+    )
+    return res.scalar_one()
+
+
+async def current(attempt: ExamAttempt) -> int:
+    # Buffered saves count in Redis; the flush carries the counter over to the database.
+    if settings.autosave_write_behind:
+        return max(attempt.revision, await autosave.revision(attempt.id))
+    return attempt.revision
@@ -0,0 +1,153 @@
+import functools
+import json
+import time
+
+from app.core.redis import get_async_redis, get_redis
+
+KEY_PREFIX = "exam:autosave"
+DIRTY_KEY = f"{KEY_PREFIX}:dirty"
+BUFFER_TTL_SECONDS = 2 * 24 * 3600
+LOCK_TTL_SECONDS = 60
+LOCK_POLL_INTERVAL = 0.05
+
+# Drops only the fields that still hold the flushed value: a save that landed
+# during the flush stays buffered for the next round.
+# KEYS[1] buffer hash; ARGV: field, value, field, value, ...
+_RELEASE = """
+for i = 1, #ARGV, 2 do
+  if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+    redis.call('HDEL', KEYS[1], ARGV[i])
+  end
+end
+return redis.call('HLEN', KEYS[1])
+"""
+
+# Stamps the value with the attempt's next revision and buffers it; with the compare flag set,
+# only if the field still holds what the caller based the new value on.
+# KEYS: buffer hash, dirty set, revision counter
+# ARGV: field, value (JSON object), expected value ('' if absent), compare flag, revision floor, ttl, attempt id
+_STORE = """
+if ARGV[4] == '1' and (redis.call('HGET', KEYS[1], ARGV[1]) or '') ~= ARGV[3] then
+  return 0
+end
+local floor = tonumber(ARGV[5])
+local revision = redis.call('INCR', KEYS[3])
+if revision <= floor then
+  revision = floor + 1
+  redis.call('SET', KEYS[3], revision)
+end
+local value = cjson.decode(ARGV[2])
+value['revision'] = revision
+redis.call('HSET', KEYS[1], ARGV[1], cjson.encode(value))
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+redis.call('EXPIRE', KEYS[3], ARGV[6])
+redis.call('SADD', KEYS[2], ARGV[7])
+return revision
+"""
+
+
+def _buffer_key(attempt_id: int) -> str:
+    return f"{KEY_PREFIX}:{attempt_id}"
+
+
+def _lock_key(attempt_id: int) -> str:
+    return f"{KEY_PREFIX}:lock:{attempt_id}"
+
+
+def _revision_key(attempt_id: int) -> str:
+    return f"{KEY_PREFIX}:revision:{attempt_id}"
+
+
+@functools.cache
+def _store_script():
+    return get_async_redis().register_script(_STORE)
+
+
+async def _store(attempt_id: int, field: str, value: dict, floor: int, expected: bytes | None = None,
+                 compare: bool = False) -> int:
+    keys = [_buffer_key(attempt_id), DIRTY_KEY, _revision_key(attempt_id)]
+    args = [field, json.dumps(value), expected or b"", int(compare), floor, BUFFER_TTL_SECONDS, attempt_id]
+    return await _store_script()(keys=keys, args=args)
+
+
+async def buffer_answer(attempt_id: int, question_id: int, selected_index: int | None, floor: int) -> int:
+    """Buffer an answer and return its revision; floor is the attempt revision already in the database."""
+    return await _store(attempt_id, f"answer:{question_id}", {"selected_index": selected_index}, floor)
+
+
+async def buffered_draft(attempt_id: int, task_id: int) -> tuple[bytes | None, dict | None]:
+    raw = await get_async_redis().hget(_buffer_key(attempt_id), f"draft:{task_id}")
+    return raw, json.loads(raw) if raw is not None else None
+
+
+async def replace_draft(attempt_id: int, task_id: int, expected: bytes | None, draft: dict, floor: int) -> int:
+    """Buffer the draft if the buffered one is still expected; returns its revision, or 0 if it changed."""
+    return await _store(attempt_id, f"draft:{task_id}", draft, floor, expected, compare=True)
+
+
+async def revision(attempt_id: int) -> int:
+    return int(await get_async_redis().get(_revision_key(attempt_id)) or 0)
+
+
+def decode(entries: dict) -> tuple[dict[int, dict], dict[int, dict]]:
+    answers, drafts = {}, {}
+    for field, value in entries.items():
+        kind, entity_id = (field.decode() if isinstance(field, bytes) else field).split(":")
+        value = json.loads(value)
+        if kind == "answer":
+            # Buffered before answers carried a revision.
+            answers[int(entity_id)] = value if isinstance(value, dict) else {"selected_index": value, "revision": 0}
+        else:
+            drafts[int(entity_id)] = value
+    return answers, drafts
+
+
+async def buffered(attempt_id: int) -> tuple[dict[int, dict], dict[int, dict]]:
+    return decode(await get_async_redis().hgetall(_buffer_key(attempt_id)))
+
+
+def take_dirty(count: int) -> list[int]:
+    return [int(attempt_id) for attempt_id in get_redis().spop(DIRTY_KEY, count) or []]
+
+
+def mark_dirty(attempt_ids) -> None:
+    if attempt_ids:
+        get_redis().sadd(DIRTY_KEY, *attempt_ids)
+
+
+def lock(attempt_ids, wait: bool = False) -> list[int]:
+    """Claim attempts for flushing; without wait, busy ones go back to the dirty set."""
+    client = get_redis()
+    locked, busy = [], []
+    deadline = time.monotonic() + LOCK_TTL_SECONDS
+    for attempt_id in attempt_ids:
+        while not client.set(_lock_key(attempt_id), 1, nx=True, ex=LOCK_TTL_SECONDS):
+            if not wait or time.monotonic() > deadline:
+                busy.append(attempt_id)
+                break
+            time.sleep(LOCK_POLL_INTERVAL)
+        else:
+            locked.append(attempt_id)
+    mark_dirty(busy)
+    return locked
+
+
+def unlock(attempt_ids) -> None:
+    if attempt_ids:
+        get_redis().delete(*(_lock_key(attempt_id) for attempt_id in attempt_ids))
+
+
+def read(attempt_ids) -> dict[int, dict]:
+    pipe = get_redis().pipeline(transaction=False)
+    for attempt_id in attempt_ids:
+        pipe.hgetall(_buffer_key(attempt_id))
+    return {attempt_id: entries for attempt_id, entries in zip(attempt_ids, pipe.execute()) if entries}
+
+
+@functools.cache
+def _release_script():
+    return get_redis().register_script(_RELEASE)
+
+
+def release(attempt_id: int, entries: dict) -> None:
+    _release_script()(keys=[_buffer_key(attempt_id)], args=[item for pair in entries.items() for item in pair])
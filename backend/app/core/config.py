@@ -15,7 +15,56 @@ class Settings(BaseSettings):
     redis_url: str = "redis://redis:6379/0"
     celery_broker_url: str = "redis://redis:6379/0"
     celery_result_backend: str = "redis://redis:6379/0"
+    celery_visibility_timeout_seconds: int = 4 * 3600
+    auto_submit_interval_seconds: int = 300
+    autosave_write_behind: bool = True
+    autosave_flush_interval_seconds: int = 2
+    autosave_flush_batch: int = 500
     frontend_origin: str = "http://localhost:5173"
+    events_heartbeat_seconds: int = 15
+    worker_db_connections: int = 10
+    scheduler_throughput_window_minutes: int = 5
+
+    judge_backend: str = "docker"
+    judge_worker_concurrency: int = 2
+    judge_pool_size: int = 2
+    judge_pool_max_uses: int = 50
+    judge_pool_idle_seconds: int = 300
+    judge_compile_cache_dir: str = "/var/cache/exam-judge/cpp"
+    judge_compile_cache_max_mb: int = 1024
+    judge_batch_testcases: bool = True
+    judge_parallel_shards: int = 1
+    judge_min_tests_per_shard: int = 4
+    judge_fail_fast: bool = True
+    judge_adaptive_order: bool = True
+    judge_verdict_cache: bool = True
+    judge_verdict_cache_ttl_seconds: int = 7 * 24 * 3600
+    judge_python_zygote: bool = True
+    judge_pin_cpus: bool = False
+    judge_container_memory_mb: int = 320
+    judge_workspace_mb: int = 64
+    judge_output_limit_mb: int = 16
+    judge_admission_control: bool = True
+    judge_admission_timeout_seconds: int = 900
+    judge_admission_lease_seconds: int = 600
+    judge_host_id: str = ""
+    judge_host_cpus: int = 0
+    judge_host_memory_mb: int = 0
+    judge_host_memory_fraction: float = 0.75
+    judge_time_limit_ms: int = 1200
+    judge_memory_limit_mb: int = 256
+    judge_language_time_factors: dict[str, float] = {"cpp": 1.0, "node": 2.0, "python": 3.0}
+    judge_language_memory_overhead_mb: dict[str, int] = {"cpp": 0, "node": 48, "python": 16}
+    judge_calibration_runs: int = 5
+    judge_calibration_multiplier: float = 2.0
+    judge_calibration_time_ms: int = 10000
+    judge_calibration_min_time_ms: int = 200
+    judge_calibration_min_memory_mb: int = 32
+    judge_process_workdir: str = "/tmp"
+    judge_process_runner: str = "judge-run"
+    judge_process_uid: int = 65534
+    judge_process_namespaces: bool = True
+    judge_cgroup_root: str = "/sys/fs/cgroup/exam-judge"
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,85 @@
+import asyncio
+import contextlib
+import json
+import logging
+
+import redis
+
+from app.core.redis import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+# One channel for all attempts: each API process holds a single subscription and
+# fans messages out in memory, instead of one Redis connection per open stream.
+CHANNEL = "exam:events"
+SUBSCRIBER_QUEUE_SIZE = 64
+RECONNECT_DELAY_SECONDS = 1.0
+
+
+def publish(attempt_id: int, event: str, **data) -> None:
+    payload = json.dumps({"attempt_id": attempt_id, "event": event, **data})
+    try:
+        get_redis().publish(CHANNEL, payload)
+    except redis.RedisError:
+        logger.warning("Failed to publish %s event for attempt %s", event, attempt_id, exc_info=True)
+
+
+def format_sse(payload: dict) -> str:
+    return f"event: {payload['event']}\ndata: {json.dumps(payload)}\n\n"
+
+
+async def listen(channel: str, on_message, on_reconnect) -> None:
+    """Feed messages of a Redis channel to on_message forever, resubscribing after connection errors."""
+    reconnect = False
+    while True:
+        pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(channel)
+            if reconnect:
+                on_reconnect()
+            async for message in pubsub.listen():
+                on_message(message["data"])
+        except (redis.RedisError, OSError):
+            logger.warning("Subscription to %s lost, reconnecting", channel, exc_info=True)
+            reconnect = True
+            await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+        finally:
+            await pubsub.aclose()
+
+
+class EventHub:
+    def __init__(self):
+        self._subscribers: dict[int, set[asyncio.Queue]] = {}
+        self._listener: asyncio.Task | None = None
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, attempt_id: int):
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(attempt_id, set()).add(queue)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(listen(CHANNEL, self._on_message, self._resync))
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers.get(attempt_id, set())
+            queues.discard(queue)
+            if not queues:
+                self._subscribers.pop(attempt_id, None)
+
+    def _on_message(self, data: bytes) -> None:
+        self._dispatch(json.loads(data))
+
+    def _dispatch(self, payload: dict) -> None:
+        for queue in self._subscribers.get(payload["attempt_id"], ()):
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                pass
+
+    def _resync(self) -> None:
+        # Messages published while the subscription was down are lost: let every client re-read.
+        for attempt_id in list(self._subscribers):
+            self._dispatch({"attempt_id": attempt_id, "event": "resync"})
+
+
+event_hub = EventHub()
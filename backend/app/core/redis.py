@@ -0,0 +1,21 @@
+import redis
+import redis.asyncio
+
+from app.core.config import settings
+
+_client: redis.Redis | None = None
+_async_client: redis.asyncio.Redis | None = None
+
+
+def get_redis() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.redis_url)
+    return _client
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    global _async_client
+    if _async_client is None:
+        _async_client = redis.asyncio.Redis.from_url(settings.redis_url)
+    return _async_client
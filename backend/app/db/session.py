@@ -3,7 +3,12 @@ from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
 
-engine = create_async_engine(settings.database_url, echo=False, pool_pre_ping=True)
+
+def make_engine(**kwargs):
+    return create_async_engine(settings.database_url, echo=False, pool_pre_ping=True, **kwargs)
+
+
+engine = make_engine()
 
 AsyncSessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
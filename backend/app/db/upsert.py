@@ -0,0 +1,10 @@
+from sqlalchemy.dialects.postgresql import insert
+
+
+def upsert(model, rows, index_elements: list[str], update: list[str]):
+    """INSERT ... ON CONFLICT (index_elements) DO UPDATE SET the update columns from the new row."""
+    stmt = insert(model).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column: stmt.excluded[column] for column in update},
+    )
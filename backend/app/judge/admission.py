@@ -0,0 +1,129 @@
+import contextlib
+import functools
+import logging
+import os
+import socket
+import time
+import uuid
+
+import redis
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "judge:capacity"
+BUDGETS_KEY = "judge:capacity-budgets"
+POLL_INTERVAL = 0.1
+# Leases of a crashed worker expire on their own instead of leaking capacity.
+LEASE_GRACE_SECONDS = 60
+
+# KEYS[1] leases zset (member "<id>:<cpus>:<memory_mb>", score = expiry), KEYS[2] budgets hash
+# ARGV: now, expires_at, lease_id, cpus, memory_mb, cpu_budget, memory_budget, host
+_ACQUIRE = """
+redis.call('HSET', KEYS[2], ARGV[8], ARGV[6] .. ':' .. ARGV[7])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local used_cpus, used_memory = 0, 0
+for _, member in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+  local _, _, cpus, memory = string.find(member, ':(%d+):(%d+)$')
+  used_cpus = used_cpus + tonumber(cpus)
+  used_memory = used_memory + tonumber(memory)
+end
+local cpus, memory = tonumber(ARGV[4]), tonumber(ARGV[5])
+-- An idle host always admits one job, even one larger than the whole budget.
+if used_cpus > 0 and (used_cpus + cpus > tonumber(ARGV[6]) or used_memory + memory > tonumber(ARGV[7])) then
+  return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3] .. ':' .. cpus .. ':' .. memory)
+redis.call('EXPIREAT', KEYS[1], math.ceil(tonumber(ARGV[2])))
+return 1
+"""
+
+
+class AdmissionTimeout(Exception):
+    pass
+
+
+def host_id() -> str:
+    return settings.judge_host_id or socket.gethostname()
+
+
+def cpu_budget() -> int:
+    return settings.judge_host_cpus or os.cpu_count() or 1
+
+
+def memory_budget_mb() -> int:
+    if settings.judge_host_memory_mb:
+        return settings.judge_host_memory_mb
+    total = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    return int(total * settings.judge_host_memory_fraction)
+
+
+def _leases_key(host: str) -> str:
+    return f"{KEY_PREFIX}:{host}"
+
+
+@functools.cache
+def _acquire_script():
+    return get_redis().register_script(_ACQUIRE)
+
+
+def _try_acquire(lease_id: str, cpus: int, memory_mb: int) -> bool:
+    now = time.time()
+    expires_at = now + settings.judge_admission_lease_seconds + LEASE_GRACE_SECONDS
+    admitted = _acquire_script()(
+        keys=[_leases_key(host_id()), BUDGETS_KEY],
+        args=[now, expires_at, lease_id, cpus, memory_mb, cpu_budget(), memory_budget_mb(), host_id()],
+    )
+    return bool(admitted)
+
+
+@contextlib.contextmanager
+def reserve(cpus: int, memory_mb: int):
+    """Hold a share of this host's CPU and memory budget while a judge job runs."""
+    if not settings.judge_admission_control:
+        yield
+        return
+    lease_id = uuid.uuid4().hex
+    deadline = time.monotonic() + settings.judge_admission_timeout_seconds
+    try:
+        while not _try_acquire(lease_id, cpus, memory_mb):
+            if time.monotonic() > deadline:
+                raise AdmissionTimeout(f"no judge capacity on {host_id()} for {cpus} CPU / {memory_mb} MB")
+            time.sleep(POLL_INTERVAL)
+    except redis.RedisError:
+        # Admission is a throttle, not a correctness guarantee: judge anyway.
+        logger.warning("Judge admission control unavailable", exc_info=True)
+        yield
+        return
+    try:
+        yield
+    finally:
+        try:
+            get_redis().zrem(_leases_key(host_id()), f"{lease_id}:{cpus}:{memory_mb}")
+        except redis.RedisError:
+            logger.warning("Failed to release judge capacity lease", exc_info=True)
+
+
+def host_report(client) -> list[dict]:
+    now = time.time()
+    hosts = []
+    for host, budget in sorted(client.hgetall(BUDGETS_KEY).items()):
+        host = host.decode()
+        cpus, memory_mb = map(int, budget.decode().split(":"))
+        used_cpus = used_memory = 0
+        leases = client.zrangebyscore(_leases_key(host), now, "+inf")
+        for member in leases:
+            _, lease_cpus, lease_memory = member.decode().rsplit(":", 2)
+            used_cpus += int(lease_cpus)
+            used_memory += int(lease_memory)
+        hosts.append({
+            "host": host,
+            "jobs": len(leases),
+            "cpus": cpus,
+            "cpus_used": used_cpus,
+            "memory_mb": memory_mb,
+            "memory_used_mb": used_memory,
+        })
+    return hosts
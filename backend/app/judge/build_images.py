@@ -1,10 +1,16 @@
 import docker
 import time
 
+from app.judge.pool import remove_stale_containers
+
+BUILD_CONTEXT = "/app/judge_images"
+IMAGE_VERSION = "5"
+VERSION_LABEL = "exam.judge.version"
+
 IMAGES = {
-    "exam-python:latest": "/app/judge_images/python",
-    "exam-node:latest": "/app/judge_images/node",
-    "exam-cpp:latest": "/app/judge_images/cpp",
+    "exam-python:latest": "python/Dockerfile",
+    "exam-node:latest": "node/Dockerfile",
+    "exam-cpp:latest": "cpp/Dockerfile",
 }
 
 
@@ -22,13 +28,26 @@ def main() -> None:
     if client is None:
         raise RuntimeError(f"Cannot connect to container runtime API: {last_error}")
 
-    for tag, path in IMAGES.items():
+    for tag, dockerfile in IMAGES.items():
         try:
-            client.images.get(tag)
-            print(f"Image already exists: {tag}")
+            image = client.images.get(tag)
+            if image.labels.get(VERSION_LABEL) == IMAGE_VERSION:
+                print(f"Image already exists: {tag}")
+                continue
+            print(f"Image is outdated: {tag}")
         except docker.errors.ImageNotFound:
-            print(f"Building image: {tag} from {path}")
-            client.images.build(path=path, tag=tag)
+            pass
+        print(f"Building image: {tag} from {dockerfile}")
+        client.images.build(
+            path=BUILD_CONTEXT,
+            dockerfile=dockerfile,
+            tag=tag,
+            labels={VERSION_LABEL: IMAGE_VERSION},
+        )
+
+    removed = remove_stale_containers(client)
+    if removed:
+        print(f"Removed stale judge containers: {removed}")
 
 
 if __name__ == "__main__":
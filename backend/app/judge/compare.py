@@ -0,0 +1,75 @@
+import hashlib
+from itertools import zip_longest
+from typing import Iterable, Iterator
+
+CHUNK_SIZE = 64 * 1024
+# Same set the in-container harness strips (awk [ \t\r\f\v]), so digests agree.
+TRAILING_WHITESPACE = " \t\r\f\v"
+
+
+def normalized_lines(chunks: Iterable[str]) -> Iterator[str]:
+    blank_run = 0
+    pieces: list[str] = []
+    for chunk in chunks:
+        lines = chunk.split("\n")
+        if len(lines) == 1:
+            pieces.append(chunk)
+            continue
+        lines[0] = "".join(pieces) + lines[0]
+        pieces = [lines.pop()]
+        for line in lines:
+            line = line.rstrip(TRAILING_WHITESPACE)
+            if not line:
+                blank_run += 1
+                continue
+            for _ in range(blank_run):
+                yield ""
+            blank_run = 0
+            yield line
+    line = "".join(pieces).rstrip(TRAILING_WHITESPACE)
+    if line:
+        for _ in range(blank_run):
+            yield ""
+        yield line
+
+
+def read_chunks(path: str) -> Iterator[str]:
+    try:
+        f = open(path, "r", encoding="utf-8", errors="replace", newline="")
+    except FileNotFoundError:
+        return
+    with f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+
+def normalize_output(text: str) -> str:
+    return "\n".join(normalized_lines([text]))
+
+
+def stream_digest(chunks: Iterable[str]) -> str:
+    digest = hashlib.sha256()
+    for index, line in enumerate(normalized_lines(chunks)):
+        if index:
+            digest.update(b"\n")
+        digest.update(line.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def output_digest(text: str) -> str:
+    return stream_digest([text])
+
+
+def outputs_match(actual: Iterable[str], expected: Iterable[str]) -> bool:
+    for got, want in zip_longest(normalized_lines(actual), normalized_lines(expected)):
+        if got != want:
+            return False
+    return True
+
+
+def input_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def testcase_fingerprint(*parts) -> str:
+    return hashlib.sha256(":".join(map(str, parts)).encode()).hexdigest()[:16]
@@ -0,0 +1,72 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+
+class CompileCache:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(source: str, flags: list[str], image_digest: str) -> str:
+        digest = hashlib.sha256()
+        for part in (image_digest, " ".join(flags), source):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def lookup(self, key: str) -> str | None:
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def store(self, key: str, binary_path: str) -> str | None:
+        if not os.path.isfile(binary_path):
+            return None
+        with open(binary_path, "rb") as f:
+            return self.store_bytes(key, f.read())
+
+    def store_bytes(self, key: str, data: bytes) -> str | None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(tmp_path, 0o755)
+            os.replace(tmp_path, self.path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+        self._evict()
+        return self.path(key)
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = []
+            total = 0
+            with os.scandir(self.root) as it:
+                for entry in it:
+                    if entry.name.startswith(".") or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
@@ -0,0 +1,48 @@
+#!/bin/sh
+# Usage: harness.sh <cpu_ms> <wall_ms> <mem_kb> <output_kb> <first> <count> <fail_fast> <program...>
+# Runs tests/<i>.in for i in [first, first + count) under judge-run and appends
+# one line per test to results.txt:
+#   "<i> <status> <exit_code> <cpu_ms> <wall_ms> <peak_kb> <sha256 of normalized stdout>"
+# With fail_fast=1 stops after the first test whose status is not OK or whose
+# digest differs from the expected one in tests/<i>.ans.
+
+cpu_ms="$1"
+wall_ms="$2"
+mem_kb="$3"
+output_kb="$4"
+first="$5"
+count="$6"
+fail_fast="$7"
+shift 7
+
+normalize() {
+    awk '{
+        sub(/[ \t\r\f\v]+$/, "")
+        if ($0 == "") { pending++; next }
+        if (started) printf "\n"
+        for (; pending > 0; pending--) printf "\n"
+        printf "%s", $0
+        started = 1
+    }'
+}
+
+i="$first"
+last=$((first + count))
+while [ "$i" -lt "$last" ]; do
+    rm -f /workspace/stats.txt
+    judge-run /workspace/stats.txt "$cpu_ms" "$wall_ms" "$mem_kb" "$output_kb" "$@" \
+        < "/workspace/tests/$i.in" > /workspace/output.txt 2> /workspace/err.txt
+    stats="RE 1 0 0 0"
+    if [ -s /workspace/stats.txt ]; then
+        stats=$(cat /workspace/stats.txt)
+    fi
+    digest=$(normalize < /workspace/output.txt | sha256sum | cut -d ' ' -f 1)
+    echo "$i $stats $digest" >> /workspace/results.txt
+    if [ "$fail_fast" = "1" ]; then
+        expected=$(cat "/workspace/tests/$i.ans" 2>/dev/null)
+        if [ "${stats%% *}" != "OK" ] || { [ -n "$expected" ] && [ "$digest" != "$expected" ]; }; then
+            break
+        fi
+    fi
+    i=$((i + 1))
+done
@@ -0,0 +1,62 @@
+import math
+
+from app.core.config import settings
+from app.judge.sandbox import IMAGE_MAP, Limits, Testcase, default_limits, run_task_in_sandbox
+
+
+class CalibrationError(Exception):
+    pass
+
+
+def task_limits(task, language: str) -> Limits:
+    limits = (task.limits or {}).get(language)
+    if not limits:
+        return default_limits()
+    return Limits(int(limits["time_ms"]), int(limits["memory_mb"]))
+
+
+def _derive_limits(language: str, cpu_ms: int, peak_kb: int) -> dict[str, dict[str, int]]:
+    factors = settings.judge_language_time_factors
+    overheads = settings.judge_language_memory_overhead_mb
+    base_time = cpu_ms / factors.get(language, 1.0)
+    base_memory = max(peak_kb / 1024 - overheads.get(language, 0), 0)
+
+    limits = {}
+    for target in IMAGE_MAP:
+        time_ms = math.ceil(base_time * factors.get(target, 1.0) * settings.judge_calibration_multiplier)
+        memory_mb = math.ceil(base_memory * settings.judge_calibration_multiplier) + overheads.get(target, 0)
+        limits[target] = {
+            "time_ms": max(time_ms, settings.judge_calibration_min_time_ms),
+            "memory_mb": min(
+                max(memory_mb, settings.judge_calibration_min_memory_mb),
+                settings.judge_container_memory_mb,
+            ),
+        }
+    return limits
+
+
+def calibrate(language: str, code: str, testcases: list[Testcase]) -> dict:
+    if language not in IMAGE_MAP:
+        raise CalibrationError(f"Unknown reference language: {language}")
+    if not testcases:
+        raise CalibrationError("Task has no testcases")
+
+    generous = Limits(settings.judge_calibration_time_ms, settings.judge_container_memory_mb)
+    cpu_samples: list[int] = []
+    peak_samples: list[int] = []
+    for _ in range(settings.judge_calibration_runs):
+        verdicts, all_ok, metrics = run_task_in_sandbox(language, code, testcases, generous)
+        if not all_ok:
+            raise CalibrationError(f"Reference solution failed: {verdicts}")
+        cpu_samples.extend(m["cpu_ms"] for m in metrics)
+        peak_samples.extend(m["peak_kb"] for m in metrics)
+
+    cpu_max = max(cpu_samples)
+    peak_max = max(peak_samples)
+    return {
+        "limits": _derive_limits(language, cpu_max, peak_max),
+        "runs": settings.judge_calibration_runs,
+        "cpu_ms_max": cpu_max,
+        "cpu_ms_median": sorted(cpu_samples)[len(cpu_samples) // 2],
+        "peak_kb_max": peak_max,
+    }
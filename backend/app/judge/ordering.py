@@ -0,0 +1,76 @@
+import logging
+
+import redis
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.judge.sandbox import Testcase
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "judge:teststats"
+STATS_TTL_SECONDS = 30 * 24 * 3600
+# Per-test overhead added to the observed wall time, so never-run tests are not treated as free.
+BASE_COST_MS = 20
+
+
+def _stats_key(task_id: int, testset_version: int) -> str:
+    return f"{KEY_PREFIX}:{task_id}:{testset_version}"
+
+
+def _load_stats(task_id: int, testset_version: int) -> dict[str, int]:
+    try:
+        raw = get_redis().hgetall(_stats_key(task_id, testset_version))
+    except redis.RedisError:
+        logger.warning("Testcase stats lookup failed", exc_info=True)
+        return {}
+    return {field.decode(): int(value) for field, value in raw.items()}
+
+
+def execution_order(task_id: int, testset_version: int, testcases: list[Testcase]) -> list[int]:
+    canonical = list(range(len(testcases)))
+    if not settings.judge_adaptive_order or len(testcases) < 2:
+        return canonical
+    stats = _load_stats(task_id, testset_version)
+
+    def priority(index: int) -> tuple:
+        testcase = testcases[index]
+        runs = stats.get(f"{testcase.id}:runs", 0)
+        fails = stats.get(f"{testcase.id}:fails", 0)
+        wall_ms = stats.get(f"{testcase.id}:wall_ms", 0)
+        fail_rate = (fails + 1) / (runs + 2)
+        cost = wall_ms / runs + BASE_COST_MS if runs else BASE_COST_MS
+        # Samples first, then the best chance of failing per millisecond spent.
+        return not testcase.sample, -fail_rate / cost, index
+
+    return sorted(canonical, key=priority)
+
+
+def permute(order: list[int], items: list) -> list:
+    return [items[index] for index in order]
+
+
+def restore(order: list[int], items: list) -> list:
+    canonical = [None] * len(order)
+    for position, index in enumerate(order):
+        canonical[index] = items[position]
+    return canonical
+
+
+def record(task_id: int, testset_version: int, testcases: list[Testcase], verdicts: list[str],
+           metrics: list[dict | None]) -> None:
+    if not settings.judge_adaptive_order:
+        return
+    key = _stats_key(task_id, testset_version)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for testcase, verdict, metric in zip(testcases, verdicts, metrics):
+            if metric is None or testcase.id is None:
+                continue
+            pipe.hincrby(key, f"{testcase.id}:runs", 1)
+            pipe.hincrby(key, f"{testcase.id}:fails", int(verdict != "AC"))
+            pipe.hincrby(key, f"{testcase.id}:wall_ms", metric["wall_ms"])
+        pipe.expire(key, STATS_TTL_SECONDS)
+        pipe.execute()
+    except redis.RedisError:
+        logger.warning("Testcase stats update failed", exc_info=True)
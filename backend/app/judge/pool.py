@@ -0,0 +1,183 @@
+import io
+import itertools
+import os
+import posixpath
+import socket
+import tarfile
+import threading
+import time
+from contextlib import contextmanager
+
+import docker
+
+from app.core.config import settings
+
+POOL_LABEL = "exam-judge-pool"
+OWNER_LABEL = "exam-judge-owner"
+WORKSPACE = "/workspace"
+
+SCRUB_CMD = (
+    "kill -s KILL -1 2>/dev/null; "
+    "rm -rf /workspace/* /workspace/.[!.]* /workspace/..?* /tmp/* /tmp/.[!.]* /tmp/..?* 2>/dev/null; "
+    "true"
+)
+
+
+class PooledContainer:
+    def __init__(self, language: str, container):
+        self.language = language
+        self.container = container
+        self.uses = 0
+        self.last_used = time.monotonic()
+
+    def put_files(self, files: dict[str, str | bytes]) -> None:
+        buffer = io.BytesIO()
+        now = time.time()
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            directories = sorted({posixpath.dirname(name) for name in files} - {""})
+            for name in directories:
+                info = tarfile.TarInfo(name)
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+                info.mtime = now
+                tar.addfile(info)
+            for name, data in files.items():
+                if isinstance(data, str):
+                    data = data.encode("utf-8")
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mode = 0o644
+                info.mtime = now
+                tar.addfile(info, io.BytesIO(data))
+        self.container.put_archive(WORKSPACE, buffer.getvalue())
+
+    def read_file(self, name: str, limit: int) -> bytes:
+        result = self.container.exec_run(["head", "-c", str(limit), f"{WORKSPACE}/{name}"], stderr=False)
+        return result.output if result.exit_code == 0 else b""
+
+    def fetch_file(self, name: str) -> bytes | None:
+        try:
+            stream, _ = self.container.get_archive(f"{WORKSPACE}/{name}")
+        except docker.errors.NotFound:
+            return None
+        with tarfile.open(fileobj=io.BytesIO(b"".join(stream))) as tar:
+            member = tar.next()
+            extracted = tar.extractfile(member) if member else None
+            return extracted.read() if extracted else None
+
+
+class ContainerPool:
+    def __init__(self, image_map: dict[str, str], extra_volumes: dict[str, dict] | None = None):
+        self._image_map = image_map
+        self._extra_volumes = extra_volumes or {}
+        self._client = None
+        self._idle: dict[str, list[PooledContainer]] = {language: [] for language in image_map}
+        self._lock = threading.Lock()
+        self._cpus = itertools.cycle(range(os.cpu_count() or 1))
+
+    def _docker(self):
+        if self._client is None:
+            self._client = docker.from_env()
+        return self._client
+
+    def _create(self, language: str) -> PooledContainer:
+        extra = {}
+        if settings.judge_pin_cpus:
+            with self._lock:
+                extra["cpuset_cpus"] = str(next(self._cpus))
+        # tmpfs pages are charged to the container, so the workspace gets its own share of memory.
+        container = self._docker().containers.run(
+            self._image_map[language],
+            ["tail", "-f", "/dev/null"],
+            detach=True,
+            network_mode="none",
+            mem_limit=f"{settings.judge_container_memory_mb + settings.judge_workspace_mb}m",
+            pids_limit=64,
+            tmpfs={WORKSPACE: f"size={settings.judge_workspace_mb}m,mode=755,exec"},
+            volumes=self._extra_volumes.get(language, {}),
+            working_dir=WORKSPACE,
+            labels={POOL_LABEL: language, OWNER_LABEL: socket.gethostname()},
+            **extra,
+        )
+        return PooledContainer(language, container)
+
+    def _destroy(self, item: PooledContainer) -> None:
+        try:
+            item.container.remove(force=True)
+        except Exception:  # noqa: BLE001
+            pass
+
+    def _scrub(self, item: PooledContainer) -> bool:
+        try:
+            result = item.container.exec_run(["/bin/sh", "-c", SCRUB_CMD])
+            item.container.reload()
+        except Exception:  # noqa: BLE001
+            return False
+        return result.exit_code == 0 and item.container.status == "running"
+
+    def _evict_idle(self) -> None:
+        cutoff = time.monotonic() - settings.judge_pool_idle_seconds
+        expired = []
+        with self._lock:
+            for language, idle in self._idle.items():
+                expired.extend(item for item in idle if item.last_used < cutoff)
+                self._idle[language] = [item for item in idle if item.last_used >= cutoff]
+        for item in expired:
+            self._destroy(item)
+
+    def warm(self) -> None:
+        for language in self._image_map:
+            with self._lock:
+                missing = settings.judge_pool_size - len(self._idle[language])
+            for _ in range(missing):
+                item = self._create(language)
+                with self._lock:
+                    self._idle[language].append(item)
+
+    def _checkout(self, language: str) -> PooledContainer:
+        self._evict_idle()
+        with self._lock:
+            idle = self._idle[language]
+            item = idle.pop() if idle else None
+        if item is None:
+            item = self._create(language)
+        item.uses += 1
+        return item
+
+    def _checkin(self, item: PooledContainer) -> None:
+        item.last_used = time.monotonic()
+        if item.uses >= settings.judge_pool_max_uses or not self._scrub(item):
+            self._destroy(item)
+            return
+        with self._lock:
+            idle = self._idle[item.language]
+            if len(idle) < settings.judge_pool_size:
+                idle.append(item)
+                return
+        self._destroy(item)
+
+    @contextmanager
+    def acquire(self, language: str):
+        item = self._checkout(language)
+        try:
+            yield item
+        finally:
+            self._checkin(item)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            items = [item for idle in self._idle.values() for item in idle]
+            for idle in self._idle.values():
+                idle.clear()
+        for item in items:
+            self._destroy(item)
+
+
+def remove_stale_containers(client) -> int:
+    stale = client.containers.list(
+        all=True,
+        filters={"label": [POOL_LABEL, f"{OWNER_LABEL}={socket.gethostname()}"]},
+    )
+    for container in stale:
+        container.remove(force=True)
+    return len(stale)
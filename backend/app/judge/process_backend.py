@@ -0,0 +1,314 @@
+import errno
+import functools
+import hashlib
+import logging
+import os
+import resource
+import subprocess
+import tempfile
+import time
+import uuid
+from typing import Tuple
+
+from app.core.config import settings
+from app.judge.compare import outputs_match, read_chunks
+from app.judge.sandbox import (
+    COMPILE_TIMEOUT,
+    CPP_FLAGS,
+    MAX_LOG_BYTES,
+    WALL_LIMIT_FACTOR,
+    Limits,
+    Testcase,
+    TestResult,
+    collect_verdicts,
+    get_compile_cache,
+)
+
+try:
+    import seccomp
+except ImportError:  # pragma: no cover - optional dependency
+    try:
+        import pyseccomp as seccomp
+    except ImportError:
+        seccomp = None
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.002
+RUNNER_MEMORY_MB = 16
+RUNNER_GRACE_SECONDS = 5
+PIDS_LIMIT = 64
+NOFILE_LIMIT = 64
+COMPILE_MEMORY_MB = 512
+COMPILE_OUTPUT_MB = 256
+
+PROGRAMS = {
+    "python": ["python3", "main.py"],
+    "node": ["node", "main.js"],
+}
+SOURCE_FILES = {"python": "main.py", "node": "main.js", "cpp": "main.cpp"}
+DENIED_SYSCALLS = [
+    "ptrace",
+    "mount",
+    "umount2",
+    "pivot_root",
+    "chroot",
+    "unshare",
+    "setns",
+    "bpf",
+    "perf_event_open",
+    "keyctl",
+    "add_key",
+    "request_key",
+    "kexec_load",
+    "init_module",
+    "finit_module",
+    "delete_module",
+    "reboot",
+    "swapon",
+    "swapoff",
+]
+SANDBOX_ENV = {"PATH": "/usr/local/bin:/usr/bin:/bin", "LANG": "C.UTF-8"}
+
+_cgroups_ready: bool | None = None
+_toolchain_digest: str | None = None
+
+
+def _write(path: str, text: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def _read_text(path: str, limit: int | None = None) -> str:
+    try:
+        with open(path, "rb") as f:
+            data = f.read(limit) if limit else f.read()
+    except FileNotFoundError:
+        return ""
+    return data.decode("utf-8", errors="ignore")
+
+
+def _cgroups_available() -> bool:
+    global _cgroups_ready
+    if _cgroups_ready is None:
+        try:
+            os.makedirs(settings.judge_cgroup_root, exist_ok=True)
+            if not os.path.exists(os.path.join(settings.judge_cgroup_root, "cgroup.controllers")):
+                raise OSError(errno.ENOTSUP, "not a cgroup v2 directory")
+            _write(os.path.join(settings.judge_cgroup_root, "cgroup.subtree_control"), "+memory +pids +cpu")
+            _cgroups_ready = True
+        except OSError:
+            logger.warning("cgroup v2 delegation unavailable at %s, falling back to rlimits",
+                           settings.judge_cgroup_root)
+            _cgroups_ready = False
+    return _cgroups_ready
+
+
+def _create_cgroup(memory_mb: int) -> str | None:
+    if not _cgroups_available():
+        return None
+    path = os.path.join(settings.judge_cgroup_root, f"run-{uuid.uuid4().hex}")
+    try:
+        os.mkdir(path)
+        _write(os.path.join(path, "memory.max"), str(memory_mb * 1024 * 1024))
+        _write(os.path.join(path, "memory.swap.max"), "0")
+        _write(os.path.join(path, "pids.max"), str(PIDS_LIMIT))
+    except OSError:
+        _remove_cgroup(path)
+        return None
+    return path
+
+
+def _remove_cgroup(path: str) -> None:
+    try:
+        _write(os.path.join(path, "cgroup.kill"), "1")
+    except OSError:
+        pass
+    for _ in range(50):
+        try:
+            os.rmdir(path)
+            return
+        except FileNotFoundError:
+            return
+        except OSError:
+            time.sleep(POLL_INTERVAL)
+
+
+def _cgroup_stat(path: str, filename: str, key: str) -> int:
+    for line in _read_text(os.path.join(path, filename)).splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[0] == key:
+            return int(parts[1])
+    return 0
+
+
+def _enter_sandbox(cgroup: str | None) -> None:
+    if cgroup:
+        with open(os.path.join(cgroup, "cgroup.procs"), "w") as f:
+            f.write(str(os.getpid()))
+    if settings.judge_process_namespaces:
+        os.unshare(os.CLONE_NEWNET | os.CLONE_NEWIPC | os.CLONE_NEWUTS)
+
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (NOFILE_LIMIT, NOFILE_LIMIT))
+    if not cgroup:
+        resource.setrlimit(resource.RLIMIT_NPROC, (PIDS_LIMIT, PIDS_LIMIT))
+
+    uid = settings.judge_process_uid
+    os.setgroups([])
+    os.setgid(uid)
+    os.setuid(uid)
+
+    if seccomp is not None:
+        syscall_filter = seccomp.SyscallFilter(defaction=seccomp.ALLOW)
+        for name in DENIED_SYSCALLS:
+            syscall_filter.add_rule(seccomp.ERRNO(errno.EPERM), name)
+        syscall_filter.load()
+
+
+def _execute(argv: list[str], workdir: str, stdin_path: str, stdout_path: str, stderr_path: str,
+             limits: Limits, wall_ms: int, output_kb: int) -> Tuple[str, int, int, int, int]:
+    stats_path = os.path.join(workdir, "stats.txt")
+    if os.path.lexists(stats_path):
+        os.remove(stats_path)
+    cgroup = _create_cgroup(limits.memory_mb + RUNNER_MEMORY_MB)
+    oom_killed = False
+    try:
+        with open(stdin_path, "rb") as stdin, open(stdout_path, "wb") as stdout, open(stderr_path, "wb") as stderr:
+            subprocess.run(
+                [
+                    settings.judge_process_runner,
+                    stats_path,
+                    str(limits.time_ms),
+                    str(wall_ms),
+                    str(limits.memory_mb * 1024),
+                    str(output_kb),
+                    *argv,
+                ],
+                stdin=stdin,
+                stdout=stdout,
+                stderr=stderr,
+                cwd=workdir,
+                env={**SANDBOX_ENV, "HOME": workdir},
+                preexec_fn=functools.partial(_enter_sandbox, cgroup),
+                timeout=wall_ms / 1000 + RUNNER_GRACE_SECONDS,
+            )
+        if cgroup:
+            oom_killed = _cgroup_stat(cgroup, "memory.events", "oom_kill") > 0
+    except subprocess.TimeoutExpired:
+        return "TLE", 137, 0, wall_ms, 0
+    finally:
+        if cgroup:
+            _remove_cgroup(cgroup)
+
+    parts = _read_text(stats_path).split()
+    if len(parts) != 5:
+        return ("MLE" if oom_killed else "RE"), 1, 0, 0, 0
+    status, exit_code, cpu_ms, elapsed_ms, peak_kb = parts[0], *map(int, parts[1:])
+    if oom_killed and status != "TLE":
+        status = "MLE"
+    return status, exit_code, cpu_ms, elapsed_ms, peak_kb
+
+
+def _toolchain() -> str:
+    global _toolchain_digest
+    if _toolchain_digest is None:
+        version = subprocess.run(["g++", "--version"], capture_output=True, check=True).stdout
+        _toolchain_digest = "process:" + hashlib.sha256(version).hexdigest()
+    return _toolchain_digest
+
+
+def _prepare(language: str, code: str, workdir: str) -> Tuple[str, list[str]]:
+    _write(os.path.join(workdir, SOURCE_FILES[language]), code)
+    if language != "cpp":
+        return "OK", PROGRAMS[language]
+
+    cache = get_compile_cache()
+    key = cache.key(code, CPP_FLAGS, _toolchain())
+    cached = cache.lookup(key)
+    if cached:
+        return "OK", [cached]
+
+    _write(os.path.join(workdir, "input.txt"), "")
+    compile_limits = Limits(int(COMPILE_TIMEOUT * 1000), COMPILE_MEMORY_MB)
+    status, _, _, _, _ = _execute(
+        ["g++", *CPP_FLAGS, "main.cpp", "-o", "main"],
+        workdir,
+        os.path.join(workdir, "input.txt"),
+        os.path.join(workdir, "compile.txt"),
+        os.path.join(workdir, "err.txt"),
+        compile_limits,
+        int(COMPILE_TIMEOUT * 1000),
+        COMPILE_OUTPUT_MB * 1024,
+    )
+    if status != "OK":
+        return ("TLE" if status == "TLE" else "RE"), []
+    binary = os.path.join(workdir, "main")
+    return "OK", [cache.store(key, binary) or binary]
+
+
+def _workspace() -> tempfile.TemporaryDirectory:
+    tmp = tempfile.TemporaryDirectory(dir=settings.judge_process_workdir, prefix="judge-")
+    os.chown(tmp.name, settings.judge_process_uid, settings.judge_process_uid)
+    return tmp
+
+
+def run_in_sandbox(language: str, code: str, input_data: str, limits: Limits) -> Tuple[str, str, str]:
+    with _workspace() as workdir:
+        status, argv = _prepare(language, code, workdir)
+        if status == "TLE":
+            return "TLE", "", ""
+        if status != "OK":
+            return "RE", "", _read_text(os.path.join(workdir, "err.txt"), MAX_LOG_BYTES)
+
+        input_path = os.path.join(workdir, "input.txt")
+        _write(input_path, input_data)
+        status, _, _, _, _ = _execute(
+            argv,
+            workdir,
+            input_path,
+            os.path.join(workdir, "output.txt"),
+            os.path.join(workdir, "err.txt"),
+            limits,
+            limits.time_ms * WALL_LIMIT_FACTOR,
+            settings.judge_output_limit_mb * 1024,
+        )
+        if status in ("TLE", "MLE", "OLE"):
+            return status, "", ""
+        return (
+            status,
+            _read_text(os.path.join(workdir, "output.txt")),
+            _read_text(os.path.join(workdir, "err.txt"), MAX_LOG_BYTES),
+        )
+
+
+def run_task_in_sandbox(
+    language: str, code: str, testcases: list[Testcase], limits: Limits
+) -> Tuple[list[str], bool, list[dict | None]]:
+    with _workspace() as workdir:
+        status, argv = _prepare(language, code, workdir)
+        if status != "OK":
+            return [status] * len(testcases), False, [None] * len(testcases)
+
+        results: list[TestResult] = []
+        input_path = os.path.join(workdir, "input.txt")
+        output_path = os.path.join(workdir, "output.txt")
+        for index, testcase in enumerate(testcases):
+            _write(input_path, testcase.input_data)
+            status, exit_code, cpu_ms, wall_ms, peak_kb = _execute(
+                argv,
+                workdir,
+                input_path,
+                output_path,
+                os.path.join(workdir, "err.txt"),
+                limits,
+                limits.time_ms * WALL_LIMIT_FACTOR,
+                settings.judge_output_limit_mb * 1024,
+            )
+            matched = status == "OK" and outputs_match(read_chunks(output_path), [testcase.expected])
+            digest = testcase.digest if matched else ""
+            results.append(TestResult(index, status, exit_code, cpu_ms, wall_ms, peak_kb, digest))
+            if settings.judge_fail_fast and not matched:
+                break
+
+    return collect_verdicts(results, testcases)
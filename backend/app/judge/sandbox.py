@@ -1,9 +1,17 @@
+import functools
+import math
 import os
-import tempfile
-from typing import Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Tuple
 import docker
 from docker.errors import ImageNotFound
 
+from app.core.config import settings
+from app.judge import admission
+from app.judge.compile_cache import CompileCache
+from app.judge.pool import ContainerPool
+
 IMAGE_MAP = {
     "python": "exam-python:latest",
     "node": "exam-node:latest",
@@ -11,12 +19,75 @@ IMAGE_MAP = {
 }
 
 MAX_LOG_BYTES = 64 * 1024
+MAX_RESULTS_BYTES = 1024 * 1024
+MAX_STATS_BYTES = 256
+WALL_LIMIT_FACTOR = 3
+COMPILE_TIMEOUT = 10.0
+TIMEOUT_EXIT_CODE = 124
+FAILURE_STATUSES = ("RE", "TLE", "MLE", "OLE")
+CPP_FLAGS = ["-O2", "-std=c++17"]
+COMPILE_CACHE_MOUNT = "/judge-cache"
+HARNESS_PATH = os.path.join(os.path.dirname(__file__), "harness.sh")
+ZYGOTE_PATH = "/usr/local/lib/judge/zygote.py"
+
+
+
+class Limits(NamedTuple):
+    time_ms: int
+    memory_mb: int
+
+
+class Testcase(NamedTuple):
+    input_data: str
+    expected: str
+    digest: str
+    id: int | None = None
+    sample: bool = False
+
+
+class TestResult(NamedTuple):
+    index: int
+    status: str
+    exit_code: int
+    cpu_ms: int
+    wall_ms: int
+    peak_kb: int
+    digest: str
+
+
+_pool: ContainerPool | None = None
+_compile_cache: CompileCache | None = None
+_image_digests: dict[str, str] = {}
 
 
 def _docker_client():
     return docker.from_env()
 
 
+def get_compile_cache() -> CompileCache:
+    global _compile_cache
+    if _compile_cache is None:
+        _compile_cache = CompileCache(
+            settings.judge_compile_cache_dir,
+            settings.judge_compile_cache_max_mb * 1024 * 1024,
+        )
+    return _compile_cache
+
+
+def get_pool() -> ContainerPool:
+    global _pool
+    if _pool is None:
+        cache_volume = {get_compile_cache().root: {"bind": COMPILE_CACHE_MOUNT, "mode": "ro"}}
+        _pool = ContainerPool(IMAGE_MAP, {"cpp": cache_volume})
+    return _pool
+
+
+def _image_digest(language: str) -> str:
+    if language not in _image_digests:
+        _image_digests[language] = _docker_client().images.get(IMAGE_MAP[language]).id
+    return _image_digests[language]
+
+
 def ensure_images():
     client = _docker_client()
     for _, image in IMAGE_MAP.items():
@@ -26,149 +97,277 @@ def ensure_images():
             raise RuntimeError(f"Judge image not found: {image}") from exc
 
 
-def normalize_output(text: str) -> str:
-    text = text.replace("\r\n", "\n")
-    lines = text.split("\n")
-    while lines and lines[-1].strip() == "":
-        lines.pop()
-    return "\n".join(line.rstrip() for line in lines)
+def _language_commands(language: str) -> Tuple[str, str | None, str]:
+    if language == "python":
+        return "main.py", None, "python /workspace/main.py"
+    if language == "node":
+        return "main.js", None, "node /workspace/main.js"
+    compile_cmd = f"g++ {' '.join(CPP_FLAGS)} /workspace/main.cpp -o /workspace/main 2> /workspace/err.txt"
+    return "main.cpp", compile_cmd, "/workspace/main"
+
+
+def default_limits() -> Limits:
+    return Limits(settings.judge_time_limit_ms, settings.judge_memory_limit_mb)
 
 
-def _read_file_limited(path: str) -> str:
-    if not os.path.exists(path):
-        return ""
-    with open(path, "rb") as f:
-        data = f.read(MAX_LOG_BYTES)
-    return data.decode("utf-8", errors="ignore")
+def output_limit_bytes() -> int:
+    return settings.judge_output_limit_mb * 1024 * 1024
 
 
-def run_in_sandbox(language: str, code: str, input_data: str) -> Tuple[str, str, str]:
+def _limit_args(limits: Limits) -> list[str]:
+    return [
+        str(limits.time_ms),
+        str(limits.time_ms * WALL_LIMIT_FACTOR),
+        str(limits.memory_mb * 1024),
+        str(settings.judge_output_limit_mb * 1024),
+    ]
+
+
+def _run_cmd(program: str, limits: Limits) -> str:
+    return (
+        f"judge-run /workspace/stats.txt {' '.join(_limit_args(limits))} {program} "
+        "< /workspace/input.txt > /workspace/output.txt 2> /workspace/err.txt"
+    )
+
+
+def _read_status(sandbox) -> str:
+    parts = sandbox.read_file("stats.txt", MAX_STATS_BYTES).decode("utf-8", errors="ignore").split()
+    return parts[0] if parts else "RE"
+
+
+def _exec(container, cmd: str, timeout: float) -> int:
+    exec_result = container.exec_run(
+        ["timeout", "-k", "1", str(timeout), "/bin/sh", "-lc", cmd],
+        workdir="/workspace",
+    )
+    return exec_result.exit_code
+
+
+def _compile(sandbox, language: str, code: str, compile_cmd: str | None, program: str) -> Tuple[str, str]:
+    if not compile_cmd:
+        return "OK", program
+
+    cache = get_compile_cache()
+    key = cache.key(code, CPP_FLAGS, _image_digest(language))
+    if cache.lookup(key):
+        return "OK", f"{COMPILE_CACHE_MOUNT}/{key}"
+
+    exit_code = _exec(sandbox.container, compile_cmd, COMPILE_TIMEOUT)
+    if exit_code == TIMEOUT_EXIT_CODE:
+        return "TLE", program
+    if exit_code != 0:
+        return "RE", program
+    binary = sandbox.fetch_file("main")
+    if binary and cache.store_bytes(key, binary):
+        return "OK", f"{COMPILE_CACHE_MOUNT}/{key}"
+    return "OK", program
+
+
+def _container_run(language: str, code: str, input_data: str, limits: Limits) -> Tuple[str, str, str]:
     ensure_images()
-    client = _docker_client()
-    image = IMAGE_MAP[language]
-
-    with tempfile.TemporaryDirectory() as tmpdir:
-        if language == "python":
-            filename = "main.py"
-            cmd = "python /workspace/main.py < /workspace/input.txt > /workspace/output.txt 2> /workspace/err.txt"
-        elif language == "node":
-            filename = "main.js"
-            cmd = "node /workspace/main.js < /workspace/input.txt > /workspace/output.txt 2> /workspace/err.txt"
-        else:
-            filename = "main.cpp"
-            cmd = (
-                "g++ -O2 -std=c++17 /workspace/main.cpp -o /workspace/main 2> /workspace/err.txt && "
-                "/workspace/main < /workspace/input.txt > /workspace/output.txt 2>> /workspace/err.txt"
-            )
-
-        with open(os.path.join(tmpdir, filename), "w", encoding="utf-8") as f:
-            f.write(code)
-        with open(os.path.join(tmpdir, "input.txt"), "w", encoding="utf-8") as f:
-            f.write(input_data)
-
-        container = client.containers.run(
-            image,
-            ["/bin/sh", "-lc", cmd],
-            detach=True,
-            network_mode="none",
-            mem_limit="256m",
-            pids_limit=64,
-            stdout=True,
-            stderr=True,
-            volumes={tmpdir: {"bind": "/workspace", "mode": "rw"}},
-            working_dir="/workspace",
-        )
+    filename, compile_cmd, program = _language_commands(language)
 
-        try:
-            result = container.wait(timeout=1.2)
-            status_code = result.get("StatusCode", 1)
-            stdout_text = _read_file_limited(os.path.join(tmpdir, "output.txt"))
-            stderr_text = _read_file_limited(os.path.join(tmpdir, "err.txt"))
-            if status_code != 0:
-                return "RE", stdout_text, stderr_text
-            return "OK", stdout_text, stderr_text
-        except Exception:
-            container.kill()
+    with get_pool().acquire(language) as sandbox:
+        sandbox.put_files({filename: code, "input.txt": input_data})
+
+        status, program = _compile(sandbox, language, code, compile_cmd, program)
+        if status == "TLE":
             return "TLE", "", ""
-        finally:
-            container.remove(force=True)
+        if status != "OK":
+            return "RE", "", sandbox.read_file("err.txt", MAX_LOG_BYTES).decode("utf-8", errors="ignore")
 
+        sandbox.container.exec_run(["/bin/sh", "-c", _run_cmd(program, limits)], workdir="/workspace")
+        status = _read_status(sandbox)
+        if status in ("TLE", "MLE", "OLE"):
+            return status, "", ""
+        stdout_text = sandbox.read_file("output.txt", output_limit_bytes()).decode("utf-8", errors="ignore")
+        stderr_text = sandbox.read_file("err.txt", MAX_LOG_BYTES).decode("utf-8", errors="ignore")
+        return status, stdout_text, stderr_text
 
-def run_task_in_sandbox(language: str, code: str, testcases: list[tuple[str, str]]) -> Tuple[list[str], bool]:
-    ensure_images()
-    client = _docker_client()
-    image = IMAGE_MAP[language]
-
-    with tempfile.TemporaryDirectory() as tmpdir:
-        if language == "python":
-            filename = "main.py"
-            run_cmd = "python /workspace/main.py < /workspace/input.txt > /workspace/output.txt 2> /workspace/err.txt"
-            compile_cmd = None
-        elif language == "node":
-            filename = "main.js"
-            run_cmd = "node /workspace/main.js < /workspace/input.txt > /workspace/output.txt 2> /workspace/err.txt"
-            compile_cmd = None
-        else:
-            filename = "main.cpp"
-            compile_cmd = "g++ -O2 -std=c++17 /workspace/main.cpp -o /workspace/main 2> /workspace/err.txt"
-            run_cmd = "/workspace/main < /workspace/input.txt > /workspace/output.txt 2>> /workspace/err.txt"
-
-        with open(os.path.join(tmpdir, filename), "w", encoding="utf-8") as f:
-            f.write(code)
-
-        container = client.containers.run(
-            image,
-            ["/bin/sh", "-lc", "tail -f /dev/null"],
-            detach=True,
-            network_mode="none",
-            mem_limit="256m",
-            pids_limit=64,
-            stdout=True,
-            stderr=True,
-            volumes={tmpdir: {"bind": "/workspace", "mode": "rw"}},
-            working_dir="/workspace",
+
+@functools.cache
+def _harness_script() -> str:
+    with open(HARNESS_PATH, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _stage_testcases(sandbox, filename: str, code: str, testcases: list[Testcase],
+                     first: int, count: int) -> None:
+    files = {filename: code, "harness.sh": _harness_script()}
+    for index in range(first, first + count):
+        files[f"tests/{index}.in"] = testcases[index].input_data
+        files[f"tests/{index}.ans"] = testcases[index].digest
+    sandbox.put_files(files)
+
+
+def _harness_command(program: str) -> Tuple[list[str], list[str]]:
+    interpreter, _, script = program.partition(" ")
+    if interpreter == "python" and settings.judge_python_zygote:
+        return ["python", ZYGOTE_PATH], [script]
+    return ["/bin/sh", "/workspace/harness.sh"], program.split()
+
+
+def _run_harness(sandbox, program: str, limits: Limits, first: int, count: int) -> None:
+    runner, argv = _harness_command(program)
+    sandbox.container.exec_run(
+        [
+            *runner,
+            *_limit_args(limits),
+            str(first),
+            str(count),
+            "1" if settings.judge_fail_fast else "0",
+            *argv,
+        ],
+        workdir="/workspace",
+    )
+
+
+def _read_results(sandbox) -> list[TestResult]:
+    results = []
+    for line in sandbox.read_file("results.txt", MAX_RESULTS_BYTES).decode("utf-8", errors="ignore").splitlines():
+        parts = line.split()
+        if len(parts) != 7:
+            continue
+        index, status, exit_code, cpu_ms, wall_ms, peak_kb, digest = parts
+        results.append(
+            TestResult(int(index), status, int(exit_code), int(cpu_ms), int(wall_ms), int(peak_kb), digest)
         )
+    return sorted(results)
 
-        verdicts: list[str] = []
-        all_ok = True
 
-        try:
-            if compile_cmd:
-                try:
-                    exec_result = container.exec_run(["/bin/sh", "-lc", compile_cmd], timeout=1.2)
-                except Exception:
-                    verdicts = ["TLE"] * len(testcases)
-                    return verdicts, False
-                if exec_result.exit_code != 0:
-                    verdicts = ["RE"] * len(testcases)
-                    return verdicts, False
-
-            for input_data, expected in testcases:
-                with open(os.path.join(tmpdir, "input.txt"), "w", encoding="utf-8") as f:
-                    f.write(input_data)
-                try:
-                    exec_result = container.exec_run(["/bin/sh", "-lc", run_cmd], timeout=1.2)
-                except Exception:
-                    verdicts.append("TLE")
-                    all_ok = False
-                    verdicts.extend(["TLE"] * (len(testcases) - len(verdicts)))
-                    break
-
-                if exec_result.exit_code != 0:
-                    verdicts.append("RE")
-                    all_ok = False
-                    verdicts.extend(["RE"] * (len(testcases) - len(verdicts)))
-                    break
-
-                stdout_text = _read_file_limited(os.path.join(tmpdir, "output.txt"))
-                out_norm = normalize_output(stdout_text)
-                exp_norm = normalize_output(expected)
-                if out_norm == exp_norm:
-                    verdicts.append("AC")
-                else:
-                    verdicts.append("WA")
-                    all_ok = False
-        finally:
-            container.remove(force=True)
-
-        return verdicts, all_ok
+def collect_verdicts(
+    results: list[TestResult], testcases: list[Testcase]
+) -> Tuple[list[str], bool, list[dict | None]]:
+    by_index = {result.index: result for result in results}
+    verdicts: list[str] = []
+    metrics: list[dict | None] = []
+    stop_verdict = None
+    for index, testcase in enumerate(testcases):
+        result = by_index.get(index)
+        if stop_verdict or result is None:
+            verdicts.append(stop_verdict or "RE")
+            metrics.append(None)
+            continue
+        if result.status != "OK":
+            verdict = result.status if result.status in FAILURE_STATUSES else "RE"
+        elif result.digest == testcase.digest:
+            verdict = "AC"
+        else:
+            verdict = "WA"
+        verdicts.append(verdict)
+        metrics.append({"cpu_ms": result.cpu_ms, "wall_ms": result.wall_ms, "peak_kb": result.peak_kb})
+        if settings.judge_fail_fast and verdict != "AC":
+            stop_verdict = verdict
+    return verdicts, all(v == "AC" for v in verdicts), metrics
+
+
+def _shard_ranges(total: int) -> list[tuple[int, int]]:
+    shards = min(settings.judge_parallel_shards, total // max(settings.judge_min_tests_per_shard, 1))
+    shards = max(shards, 1)
+    size = math.ceil(total / shards) if total else 0
+    return [(first, min(size, total - first)) for first in range(0, total, size)] if size else []
+
+
+class _FailureTracker:
+    def __init__(self):
+        self.first_failure = math.inf
+        self._lock = threading.Lock()
+
+    def record(self, results: list[TestResult], testcases: list[Testcase]) -> None:
+        if not settings.judge_fail_fast:
+            return
+        with self._lock:
+            for result in results:
+                if result.status != "OK" or result.digest != testcases[result.index].digest:
+                    self.first_failure = min(self.first_failure, result.index)
+
+    def skip(self, index: int) -> bool:
+        return index > self.first_failure
+
+
+def _run_shard(sandbox, filename: str, code: str, program: str, limits: Limits, testcases: list[Testcase],
+               first: int, count: int, tracker: _FailureTracker) -> list[TestResult]:
+    if tracker.skip(first):
+        return []
+    _stage_testcases(sandbox, filename, code, testcases, first, count)
+    if settings.judge_batch_testcases:
+        _run_harness(sandbox, program, limits, first, count)
+    else:
+        for index in range(first, first + count):
+            if tracker.skip(index):
+                break
+            _run_harness(sandbox, program, limits, index, 1)
+            tracker.record(_read_results(sandbox), testcases)
+    results = _read_results(sandbox)
+    tracker.record(results, testcases)
+    return results
+
+
+def _run_pooled_shard(language: str, filename: str, code: str, program: str, limits: Limits,
+                      testcases: list[Testcase], first: int, count: int,
+                      tracker: _FailureTracker) -> list[TestResult]:
+    if tracker.skip(first):
+        return []
+    with get_pool().acquire(language) as sandbox:
+        return _run_shard(sandbox, filename, code, program, limits, testcases, first, count, tracker)
+
+
+def _container_run_task(
+    language: str, code: str, testcases: list[Testcase], limits: Limits
+) -> Tuple[list[str], bool, list[dict | None]]:
+    ensure_images()
+    filename, compile_cmd, program = _language_commands(language)
+    tracker = _FailureTracker()
+
+    with get_pool().acquire(language) as sandbox:
+        sandbox.put_files({filename: code})
+
+        status, program = _compile(sandbox, language, code, compile_cmd, program)
+        if status != "OK":
+            return [status] * len(testcases), False, [None] * len(testcases)
+
+        shards = _shard_ranges(len(testcases))
+        if program.startswith("/workspace/"):
+            shards = [(0, len(testcases))] if testcases else []
+        if not shards:
+            return [], True, []
+
+        results: list[TestResult] = []
+        with ThreadPoolExecutor(max_workers=max(len(shards) - 1, 1)) as executor:
+            futures = [
+                executor.submit(
+                    _run_pooled_shard, language, filename, code, program, limits, testcases, first, count, tracker
+                )
+                for first, count in shards[1:]
+            ]
+            first, count = shards[0]
+            results.extend(_run_shard(sandbox, filename, code, program, limits, testcases, first, count, tracker))
+            for future in futures:
+                results.extend(future.result())
+
+    return collect_verdicts(results, testcases)
+
+
+def run_in_sandbox(
+    language: str, code: str, input_data: str, limits: Limits | None = None
+) -> Tuple[str, str, str]:
+    limits = limits or default_limits()
+    if settings.judge_backend == "process":
+        from app.judge import process_backend
+
+        return process_backend.run_in_sandbox(language, code, input_data, limits)
+    return _container_run(language, code, input_data, limits)
+
+
+def run_task_in_sandbox(
+    language: str, code: str, testcases: list[Testcase], limits: Limits | None = None
+) -> Tuple[list[str], bool, list[dict | None]]:
+    limits = limits or default_limits()
+    if settings.judge_backend == "process":
+        from app.judge import process_backend
+
+        with admission.reserve(1, limits.memory_mb + process_backend.RUNNER_MEMORY_MB):
+            return process_backend.run_task_in_sandbox(language, code, testcases, limits)
+    containers = len(_shard_ranges(len(testcases))) or 1
+    with admission.reserve(containers, containers * (settings.judge_container_memory_mb + settings.judge_workspace_mb)):
+        return _container_run_task(language, code, testcases, limits)
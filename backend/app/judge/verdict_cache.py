@@ -0,0 +1,49 @@
+import hashlib
+import json
+import logging
+from typing import Tuple
+
+import redis
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.judge.sandbox import Limits
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "judge:verdicts"
+# Near-limit timings are noisy; a TLE is worth re-running rather than replaying.
+UNCACHED_VERDICTS = ("TLE",)
+
+
+def normalize_code(code: str) -> str:
+    return code.replace("\r\n", "\n").rstrip()
+
+
+def cache_key(task_id: int, testset_version: int, language: str, limits: Limits, code: str) -> str:
+    code_hash = hashlib.sha256(normalize_code(code).encode("utf-8")).hexdigest()
+    return f"{KEY_PREFIX}:{task_id}:{testset_version}:{language}:{limits.time_ms}:{limits.memory_mb}:{code_hash}"
+
+
+def lookup(key: str) -> Tuple[list[str], bool, list[dict | None]] | None:
+    if not settings.judge_verdict_cache:
+        return None
+    try:
+        raw = get_redis().get(key)
+    except redis.RedisError:
+        logger.warning("Verdict cache lookup failed", exc_info=True)
+        return None
+    if raw is None:
+        return None
+    entry = json.loads(raw)
+    return entry["verdicts"], entry["all_ok"], entry["metrics"]
+
+
+def store(key: str, verdicts: list[str], all_ok: bool, metrics: list[dict | None]) -> None:
+    if not settings.judge_verdict_cache or any(v in UNCACHED_VERDICTS for v in verdicts):
+        return
+    entry = json.dumps({"verdicts": verdicts, "all_ok": all_ok, "metrics": metrics})
+    try:
+        get_redis().set(key, entry, ex=settings.judge_verdict_cache_ttl_seconds)
+    except redis.RedisError:
+        logger.warning("Verdict cache store failed", exc_info=True)
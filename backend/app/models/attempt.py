@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey, DateTime, String, Integer, Boolean, JSON, Text
+from sqlalchemy import ForeignKey, DateTime, String, Integer, Boolean, JSON, Text, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from datetime import datetime
 
@@ -7,6 +7,10 @@ from app.db.base import Base
 
 class ExamAttempt(Base):
     __tablename__ = "exam_attempts"
+    __table_args__ = (
+        Index("ix_exam_attempts_status_ends_at", "status", "ends_at"),
+        Index("ix_exam_attempts_user_id", "user_id", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
@@ -16,6 +20,8 @@ class ExamAttempt(Base):
     submitted_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     score_total: Mapped[int | None] = mapped_column(Integer, nullable=True)
     score_blocks: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    # Last revision handed out to a save of this attempt's answers or drafts.
+    revision: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
 
     user = relationship("User", back_populates="attempts")
     answers = relationship("AttemptAnswer", back_populates="attempt", cascade="all, delete-orphan")
@@ -24,11 +30,16 @@ class ExamAttempt(Base):
 
 class AttemptAnswer(Base):
     __tablename__ = "attempt_answers"
+    __table_args__ = (
+        Index("ix_attempt_answers_question_id", "question_id"),
+        Index("ix_attempt_answers_attempt_question", "attempt_id", "question_id", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     attempt_id: Mapped[int] = mapped_column(ForeignKey("exam_attempts.id", ondelete="CASCADE"))
     question_id: Mapped[int] = mapped_column(ForeignKey("questions.id", ondelete="CASCADE"))
     selected_index: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    revision: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
     is_correct: Mapped[bool | None] = mapped_column(Boolean, nullable=True)
 
     attempt = relationship("ExamAttempt", back_populates="answers")
@@ -36,13 +47,23 @@ class AttemptAnswer(Base):
 
 class AttemptProg(Base):
     __tablename__ = "attempt_prog"
+    __table_args__ = (
+        Index("ix_attempt_prog_task_id", "task_id"),
+        Index("ix_attempt_prog_attempt_task", "attempt_id", "task_id", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     attempt_id: Mapped[int] = mapped_column(ForeignKey("exam_attempts.id", ondelete="CASCADE"))
     task_id: Mapped[int] = mapped_column(ForeignKey("prog_tasks.id", ondelete="CASCADE"))
     language: Mapped[str | None] = mapped_column(String(20), nullable=True)
     code: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Bumped on every save; clients send text edits against a known version.
+    version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    revision: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
     verdicts: Mapped[list | None] = mapped_column(JSON, nullable=True)
+    metrics: Mapped[list | None] = mapped_column(JSON, nullable=True)
+    # [testcase id, fingerprint] per verdict, so a regrade knows which results are still valid.
+    judged_tests: Mapped[list | None] = mapped_column(JSON, nullable=True)
     is_correct: Mapped[bool | None] = mapped_column(Boolean, nullable=True)
 
     attempt = relationship("ExamAttempt", back_populates="prog_answers")
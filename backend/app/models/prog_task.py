@@ -1,7 +1,8 @@
-from sqlalchemy import String, Integer, Boolean, Text, ForeignKey
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import String, Integer, Boolean, Text, ForeignKey, JSON
+from sqlalchemy.orm import Mapped, mapped_column, relationship, validates
 
 from app.db.base import Base
+from app.judge.compare import input_digest, normalize_output, output_digest
 
 
 class ProgTask(Base):
@@ -12,6 +13,12 @@ class ProgTask(Base):
     statement: Mapped[str] = mapped_column(Text)
     points: Mapped[int] = mapped_column(Integer, default=1)
     published: Mapped[bool] = mapped_column(Boolean, default=False)
+    limits: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    reference_language: Mapped[str | None] = mapped_column(String(20), nullable=True)
+    reference_code: Mapped[str | None] = mapped_column(Text, nullable=True)
+    calibration: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    # Bumped by a database trigger on every prog_testcases insert/update/delete.
+    testset_version: Mapped[int] = mapped_column(Integer, default=1, server_default="1")
 
     testcases = relationship("ProgTestcase", back_populates="task", cascade="all, delete-orphan")
 
@@ -20,9 +27,23 @@ class ProgTestcase(Base):
     __tablename__ = "prog_testcases"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    task_id: Mapped[int] = mapped_column(ForeignKey("prog_tasks.id", ondelete="CASCADE"))
+    task_id: Mapped[int] = mapped_column(ForeignKey("prog_tasks.id", ondelete="CASCADE"), index=True)
     input_data: Mapped[str] = mapped_column(Text)
+    input_digest: Mapped[str] = mapped_column(String(64))
     output_data: Mapped[str] = mapped_column(Text)
+    output_normalized: Mapped[str] = mapped_column(Text)
+    output_digest: Mapped[str] = mapped_column(String(64))
     is_hidden: Mapped[bool] = mapped_column(Boolean, default=False)
 
     task = relationship("ProgTask", back_populates="testcases")
+
+    @validates("input_data")
+    def _hash_input(self, _, value: str) -> str:
+        self.input_digest = input_digest(value)
+        return value
+
+    @validates("output_data")
+    def _normalize_expected(self, _, value: str) -> str:
+        self.output_normalized = normalize_output(value)
+        self.output_digest = output_digest(value)
+        return value
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from datetime import datetime
 
 
@@ -6,21 +6,43 @@ class AnswerIn(BaseModel):
     selected_index: int | None
 
 
+class DraftEdit(BaseModel):
+    # Offsets into the base version's text, in UTF-16 code units like JavaScript strings.
+    start: int
+    end: int
+    text: str
+
+
 class DraftIn(BaseModel):
     language: str
-    code: str
+    code: str | None = None
+    base_version: int | None = None
+    edits: list[DraftEdit] | None = None
+
+    @model_validator(mode="after")
+    def _code_or_edits(self):
+        if (self.code is None) == (self.edits is None):
+            raise ValueError("Send either code or edits")
+        if self.edits is not None and self.base_version is None:
+            raise ValueError("edits require base_version")
+        return self
 
 
-class ExamStateOut(BaseModel):
+class AttemptStateOut(BaseModel):
     attempt_id: int
     status: str
     started_at: datetime
     ends_at: datetime
+    revision: int
+    catalog_version: int | None
+    answers: dict
+    drafts: dict
+
+
+class ExamStateOut(AttemptStateOut):
     math_questions: list
     ru_questions: list
     prog_tasks: list
-    answers: dict
-    drafts: dict
 
 
 class ExamResultOut(BaseModel):
@@ -30,3 +52,4 @@ class ExamResultOut(BaseModel):
     score_blocks: dict
     per_question: dict
     per_task: dict
+    pending_blocks: list[str]
@@ -6,6 +6,9 @@ class ProgTaskIn(BaseModel):
     statement: str
     points: int = 1
     published: bool = False
+    limits: dict | None = None
+    reference_language: str | None = None
+    reference_code: str | None = None
 
 
 class ProgTaskOut(BaseModel):
@@ -14,6 +17,11 @@ class ProgTaskOut(BaseModel):
     statement: str
     points: int
     published: bool
+    limits: dict | None
+    reference_language: str | None
+    reference_code: str | None
+    calibration: dict | None
+    testset_version: int
 
     class Config:
         from_attributes = True
@@ -1,5 +1,12 @@
+import logging
+
 from celery import Celery
+from celery.signals import task_postrun, worker_init, worker_process_init, worker_process_shutdown
+
 from app.core.config import settings
+from app.worker import scheduling
+
+logger = logging.getLogger(__name__)
 
 celery_app = Celery(
     "exam",
@@ -7,11 +14,81 @@ celery_app = Celery(
     backend=settings.celery_result_backend,
 )
 
+GRADING_QUEUE = "grading"
+JUDGE_QUEUE = "judge"
+
+celery_app.conf.task_default_queue = GRADING_QUEUE
+# Deadline tasks wait in the broker until ends_at; they must not be redelivered before that.
+celery_app.conf.broker_transport_options = {
+    "visibility_timeout": settings.celery_visibility_timeout_seconds,
+    "priority_steps": scheduling.PRIORITY_STEPS,
+    "sep": scheduling.PRIORITY_SEP,
+    "queue_order_strategy": "priority",
+}
+celery_app.conf.task_default_priority = scheduling.GRADING_PRIORITY["timed_out"]
+# Prefetched messages bypass broker priorities, so take one at a time.
+celery_app.conf.worker_prefetch_multiplier = 1
+celery_app.conf.task_routes = {
+    "judge_draft": {"queue": JUDGE_QUEUE},
+    "calibrate_task": {"queue": JUDGE_QUEUE},
+    "regrade_prog_task": {"queue": JUDGE_QUEUE},
+}
+
 celery_app.conf.beat_schedule = {
     "auto_submit_expired": {
         "task": "auto_submit_expired",
-        "schedule": 60.0,
-    }
+        "schedule": float(settings.auto_submit_interval_seconds),
+    },
+    "flush_autosaves": {
+        "task": "flush_autosaves",
+        "schedule": float(settings.autosave_flush_interval_seconds),
+        "options": {"expires": float(settings.autosave_flush_interval_seconds)},
+    },
 }
 
 celery_app.autodiscover_tasks(["app.worker.tasks"])
+
+
+@worker_init.connect
+def _remember_concurrency(sender=None, **_):
+    from app.worker import runtime
+
+    runtime.set_concurrency(getattr(sender, "concurrency", None))
+
+
+@task_postrun.connect
+def _count_completion(sender=None, **_):
+    queue = (sender.request.delivery_info or {}).get("routing_key")
+    if queue in (GRADING_QUEUE, JUDGE_QUEUE):
+        scheduling.record_completion(queue)
+
+
+@worker_process_init.connect
+def _start_runtime(**_):
+    from app.worker import runtime
+
+    runtime.start()
+
+
+@worker_process_init.connect
+def _warm_judge_pool(**_):
+    from app.judge.sandbox import get_pool
+
+    try:
+        get_pool().warm()
+    except Exception:  # noqa: BLE001
+        logger.exception("Failed to warm judge container pool")
+
+
+@worker_process_shutdown.connect
+def _shutdown_judge_pool(**_):
+    from app.judge.sandbox import get_pool
+
+    get_pool().shutdown()
+
+
+@worker_process_shutdown.connect
+def _stop_runtime(**_):
+    from app.worker import runtime
+
+    runtime.stop()
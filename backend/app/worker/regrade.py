@@ -0,0 +1,78 @@
+import logging
+import uuid
+
+import redis
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "regrade"
+PROGRESS_TTL_SECONDS = 24 * 3600
+COUNTERS = ("total", "done", "drafts", "changed_attempts")
+
+
+def _key(job_id: str) -> str:
+    return f"{KEY_PREFIX}:{job_id}"
+
+
+def create_job(entity: str, entity_id: int) -> str:
+    job_id = uuid.uuid4().hex
+    update(job_id, entity=entity, entity_id=entity_id, status="queued", **dict.fromkeys(COUNTERS, 0))
+    return job_id
+
+
+def update(job_id: str, **fields) -> None:
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hset(_key(job_id), mapping=fields)
+        pipe.expire(_key(job_id), PROGRESS_TTL_SECONDS)
+        pipe.execute()
+    except redis.RedisError:
+        logger.warning("Failed to update regrade progress", exc_info=True)
+
+
+def advance(job_id: str, changed_attempts: int) -> None:
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hincrby(_key(job_id), "done", 1)
+        pipe.hincrby(_key(job_id), "changed_attempts", changed_attempts)
+        pipe.execute()
+    except redis.RedisError:
+        logger.warning("Failed to update regrade progress", exc_info=True)
+
+
+def progress(job_id: str) -> dict | None:
+    raw = get_redis().hgetall(_key(job_id))
+    if not raw:
+        return None
+    job = {field.decode(): value.decode() for field, value in raw.items()}
+    for field in ("entity_id", *COUNTERS):
+        job[field] = int(job.get(field, 0))
+    return {"job_id": job_id, **job}
+
+
+def reusable_results(draft, fingerprints: dict[int, str]) -> dict[int, tuple[str, dict]]:
+    """Results of the draft's last judging that still hold for the current testcases."""
+    if not draft.judged_tests or not draft.verdicts:
+        return {}
+    reusable = {}
+    for (testcase_id, fingerprint), verdict, metrics in zip(draft.judged_tests, draft.verdicts, draft.metrics or []):
+        # No metrics means the test was skipped after a fail-fast stop and never actually ran.
+        if metrics is not None and fingerprints.get(testcase_id) == fingerprint:
+            reusable[testcase_id] = (verdict, metrics)
+    return reusable
+
+
+def settled(reusable: dict[int, tuple[str, dict]]) -> bool:
+    # With fail-fast judging one genuine failure on an unchanged test decides the draft.
+    return settings.judge_fail_fast and any(verdict != "AC" for verdict, _ in reusable.values())
+
+
+def merge(testcase_ids: list[int], *sources: dict[int, tuple[str, dict | None]]):
+    results = [next((source[tid] for source in sources if tid in source), None) for tid in testcase_ids]
+    stop_verdict = next((result[0] for result in results if result and result[0] != "AC"), "RE")
+    verdicts = [result[0] if result else stop_verdict for result in results]
+    metrics = [result[1] if result else None for result in results]
+    return verdicts, all(v == "AC" for v in verdicts), metrics
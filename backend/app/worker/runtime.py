@@ -0,0 +1,45 @@
+import asyncio
+import os
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal, make_engine
+
+_loop: asyncio.AbstractEventLoop | None = None
+_engine = None
+_concurrency: int | None = None
+
+
+def set_concurrency(concurrency: int | None) -> None:
+    global _concurrency
+    _concurrency = concurrency
+
+
+def pool_size() -> int:
+    # Prefork children run one task at a time; split the per-node budget between them.
+    concurrency = _concurrency or os.cpu_count() or 1
+    return max(1, settings.worker_db_connections // concurrency)
+
+
+def start() -> None:
+    global _loop, _engine
+    if _loop is not None:
+        return
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    _engine = make_engine(pool_size=pool_size(), max_overflow=0)
+    AsyncSessionLocal.configure(bind=_engine)
+
+
+def run(coro):
+    start()
+    return _loop.run_until_complete(coro)
+
+
+def stop() -> None:
+    global _loop, _engine
+    if _loop is None:
+        return
+    _loop.run_until_complete(_engine.dispose())
+    _loop.close()
+    _loop = None
+    _engine = None
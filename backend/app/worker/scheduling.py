@@ -0,0 +1,68 @@
+import logging
+import time
+
+import redis
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Redis transport priorities: 0 is served first. Explicit submits beat deadline
+# closes, and MCQ scoring (one cheap SQL pass) beats judging programs.
+PRIORITY_STEPS = list(range(10))
+PRIORITY_SEP = ":"
+GRADING_PRIORITY = {"submitted": 0, "timed_out": 2}
+JUDGE_PRIORITY = {"submitted": 4, "timed_out": 6}
+REGRADE_PRIORITY = 8
+CALIBRATION_PRIORITY = 9
+
+THROUGHPUT_PREFIX = "celery:completed"
+THROUGHPUT_BUCKET_SECONDS = 60
+THROUGHPUT_TTL_SECONDS = 3600
+
+
+def grading_priority(status: str) -> int:
+    return GRADING_PRIORITY.get(status, GRADING_PRIORITY["timed_out"])
+
+
+def judge_priority(status: str) -> int:
+    return JUDGE_PRIORITY.get(status, JUDGE_PRIORITY["timed_out"])
+
+
+def priority_queue_keys(queue: str) -> list[str]:
+    return [queue if priority == 0 else f"{queue}{PRIORITY_SEP}{priority}" for priority in PRIORITY_STEPS]
+
+
+def _bucket(now: float) -> int:
+    return int(now) // THROUGHPUT_BUCKET_SECONDS
+
+
+def record_completion(queue: str) -> None:
+    key = f"{THROUGHPUT_PREFIX}:{queue}:{_bucket(time.time())}"
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.incr(key)
+        pipe.expire(key, THROUGHPUT_TTL_SECONDS)
+        pipe.execute()
+    except redis.RedisError:
+        logger.warning("Failed to record task completion", exc_info=True)
+
+
+def queue_report(client, queues: list[str]) -> dict[str, dict]:
+    """Backlog per queue with an ETA from the throughput of the last few minutes."""
+    window = max(settings.scheduler_throughput_window_minutes, 1)
+    current = _bucket(time.time())
+    report = {}
+    for queue in queues:
+        depth = sum(client.llen(key) for key in priority_queue_keys(queue))
+        # The current bucket is still filling up, so it is left out of the rate.
+        buckets = [f"{THROUGHPUT_PREFIX}:{queue}:{bucket}" for bucket in range(current - window, current)]
+        completed = sum(int(value or 0) for value in client.mget(buckets))
+        rate = completed / (window * THROUGHPUT_BUCKET_SECONDS)
+        report[queue] = {
+            "depth": depth,
+            "completed_per_minute": round(rate * 60, 1),
+            "eta_seconds": round(depth / rate) if rate else None,
+        }
+    return report
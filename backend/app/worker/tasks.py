@@ -1,15 +1,50 @@
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from sqlalchemy import select
+from celery import chord, group
+from sqlalchemy import bindparam, func, select, update
 
+from app.core import autosave, events
+from app.core.config import settings
+from app.worker import regrade, runtime, scheduling
 from app.worker.celery_app import celery_app
 from app.db.session import AsyncSessionLocal
+from app.db.upsert import upsert
 from app.models import ExamAttempt, AttemptAnswer, AttemptProg, Question, ProgTask, ProgTestcase
-from app.judge.sandbox import run_task_in_sandbox
+from app.judge.sandbox import Limits, Testcase, run_task_in_sandbox
+from app.judge.limits import CalibrationError, calibrate, task_limits
+from app.judge import ordering, verdict_cache
+from app.judge.compare import testcase_fingerprint
+
+
+# Keeps a multi-row upsert well below the 32767 bind parameters asyncpg allows.
+UPSERT_CHUNK = 1000
+
+_judge_executor: ThreadPoolExecutor | None = None
 
 
 def _run(coro):
-    return asyncio.run(coro)
+    return runtime.run(coro)
+
+
+def _get_judge_executor() -> ThreadPoolExecutor:
+    global _judge_executor
+    if _judge_executor is None:
+        _judge_executor = ThreadPoolExecutor(
+            max_workers=settings.judge_worker_concurrency, thread_name_prefix="judge"
+        )
+    return _judge_executor
+
+
+def _judge_testcases(rows) -> list[Testcase]:
+    return [Testcase(tc.input_data, tc.output_normalized, tc.output_digest, tc.id, not tc.is_hidden) for tc in rows]
+
+
+def _judged_tests(rows, limits: Limits) -> list[list]:
+    return [
+        [tc.id, testcase_fingerprint(tc.input_digest, tc.output_digest, limits.time_ms, limits.memory_mb)]
+        for tc in rows
+    ]
 
 
 @celery_app.task(name="grade_attempt")
@@ -17,26 +52,170 @@ def grade_attempt(attempt_id: int):
     _run(_grade_attempt(attempt_id))
 
 
+@celery_app.task(name="judge_draft", autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
+def judge_draft(attempt_id: int, task_id: int):
+    _run(_judge_attempt_task(attempt_id, task_id))
+
+
+@celery_app.task(name="finalize_attempt")
+def finalize_attempt(attempt_id: int):
+    _run(_finalize_attempt(attempt_id))
+
+
+@celery_app.task(name="calibrate_task")
+def calibrate_task(task_id: int):
+    _run(_calibrate_task(task_id))
+
+
+@celery_app.task(name="close_attempt")
+def close_attempt(attempt_id: int):
+    _run(_close_attempt(attempt_id))
+
+
+@celery_app.task(name="regrade_question")
+def regrade_question(job_id: str, question_id: int):
+    _run(_regrade(job_id, _regrade_question(job_id, question_id)))
+
+
+@celery_app.task(name="regrade_prog_task")
+def regrade_prog_task(job_id: str, task_id: int):
+    _run(_regrade(job_id, _regrade_prog_task(job_id, task_id)))
+
+
+@celery_app.task(name="flush_autosaves")
+def flush_autosaves():
+    _run(_flush_dirty_autosaves())
+
+
 @celery_app.task(name="auto_submit_expired")
 def auto_submit_expired():
     _run(_auto_submit_expired())
 
 
-async def _auto_submit_expired():
+async def _time_out_expired(*conditions) -> list[int]:
     async with AsyncSessionLocal() as session:
         now = datetime.now(timezone.utc)
+        # Row locks make concurrent runs claim disjoint sets of attempts.
         res = await session.execute(
-            select(ExamAttempt).where(ExamAttempt.status == "in_progress", ExamAttempt.ends_at < now)
+            update(ExamAttempt)
+            .where(ExamAttempt.status == "in_progress", ExamAttempt.ends_at <= now, *conditions)
+            .values(status="timed_out", submitted_at=now)
+            .returning(ExamAttempt.id)
         )
-        attempts = res.scalars().all()
-        for attempt in attempts:
-            attempt.status = "timed_out"
-            attempt.submitted_at = now
-            await session.commit()
-            grade_attempt.delay(attempt.id)
+        attempt_ids = res.scalars().all()
+        await session.commit()
+    if attempt_ids:
+        priority = scheduling.grading_priority("timed_out")
+        group(grade_attempt.si(attempt_id).set(priority=priority) for attempt_id in attempt_ids).apply_async()
+    return attempt_ids
+
+
+async def _auto_submit_expired():
+    await _time_out_expired()
+
+
+async def _close_attempt(attempt_id: int):
+    if await _time_out_expired(ExamAttempt.id == attempt_id):
+        return
+    async with AsyncSessionLocal() as session:
+        res = await session.execute(select(ExamAttempt).where(ExamAttempt.id == attempt_id))
+        attempt = res.scalar_one_or_none()
+    # Fired early because of clock skew between the API and this worker: try again at the deadline.
+    if attempt and attempt.status == "in_progress":
+        close_attempt.apply_async(args=[attempt_id], eta=attempt.ends_at)
+
+
+async def _flush_dirty_autosaves():
+    while True:
+        attempt_ids = autosave.take_dirty(settings.autosave_flush_batch)
+        if attempt_ids:
+            await _flush_autosaves(attempt_ids)
+        if len(attempt_ids) < settings.autosave_flush_batch:
+            return
+
+
+async def _flush_autosaves(attempt_ids: list[int], wait: bool = False):
+    locked = autosave.lock(attempt_ids, wait=wait)
+    try:
+        buffers = autosave.read(locked)
+        if buffers:
+            async with AsyncSessionLocal() as session:
+                await _store_autosaves(session, buffers)
+                await session.commit()
+            for attempt_id, entries in buffers.items():
+                autosave.release(attempt_id, entries)
+    except Exception:
+        autosave.mark_dirty(locked)
+        raise
+    finally:
+        autosave.unlock(locked)
+
+
+async def _store_autosaves(session, buffers: dict[int, dict]):
+    answers, drafts = {}, {}
+    for attempt_id, entries in buffers.items():
+        attempt_answers, attempt_drafts = autosave.decode(entries)
+        answers.update(((attempt_id, question_id), value) for question_id, value in attempt_answers.items())
+        drafts.update(((attempt_id, task_id), value) for task_id, value in attempt_drafts.items())
+
+    # Saves are not checked against the catalog on the way in; unknown ids would fail the whole batch.
+    if answers:
+        res = await session.execute(select(Question.id).where(Question.id.in_({key[1] for key in answers})))
+        known = set(res.scalars().all())
+        rows = [
+            {
+                "attempt_id": attempt_id,
+                "question_id": question_id,
+                "selected_index": value["selected_index"],
+                "revision": value["revision"],
+            }
+            for (attempt_id, question_id), value in answers.items()
+            if question_id in known
+        ]
+        for first in range(0, len(rows), UPSERT_CHUNK):
+            chunk = rows[first:first + UPSERT_CHUNK]
+            await session.execute(
+                upsert(AttemptAnswer, chunk, ["attempt_id", "question_id"], ["selected_index", "revision"])
+            )
+
+    if drafts:
+        res = await session.execute(select(ProgTask.id).where(ProgTask.id.in_({key[1] for key in drafts})))
+        known = set(res.scalars().all())
+        rows = [
+            {
+                "attempt_id": attempt_id,
+                "task_id": task_id,
+                "language": value["language"],
+                "code": value["code"],
+                "version": value.get("version", 0),
+                "revision": value.get("revision", 0),
+            }
+            for (attempt_id, task_id), value in drafts.items()
+            if task_id in known
+        ]
+        for first in range(0, len(rows), UPSERT_CHUNK):
+            chunk = rows[first:first + UPSERT_CHUNK]
+            await session.execute(
+                upsert(AttemptProg, chunk, ["attempt_id", "task_id"], ["language", "code", "version", "revision"])
+            )
+
+    # The Redis revision counter may expire; the database copy is the floor it restarts from.
+    last_revisions = {}
+    for (attempt_id, _), value in [*answers.items(), *drafts.items()]:
+        last_revisions[attempt_id] = max(last_revisions.get(attempt_id, 0), value.get("revision", 0))
+    attempts = ExamAttempt.__table__
+    await session.execute(
+        update(attempts)
+        .where(attempts.c.id == bindparam("attempt"))
+        .values(revision=func.greatest(attempts.c.revision, bindparam("last"))),
+        [{"attempt": attempt_id, "last": last} for attempt_id, last in last_revisions.items()],
+    )
 
 
 async def _grade_attempt(attempt_id: int):
+    # Saves still buffered in Redis must reach the database before anything is scored.
+    if settings.autosave_write_behind:
+        await _flush_autosaves([attempt_id], wait=True)
     async with AsyncSessionLocal() as session:
         res = await session.execute(select(ExamAttempt).where(ExamAttempt.id == attempt_id))
         attempt = res.scalar_one_or_none()
@@ -45,7 +224,6 @@ async def _grade_attempt(attempt_id: int):
 
         score_math = 0
         score_ru = 0
-        score_prog = 0
 
         res_ans = await session.execute(select(AttemptAnswer).where(AttemptAnswer.attempt_id == attempt.id))
         answers = res_ans.scalars().all()
@@ -69,30 +247,295 @@ async def _grade_attempt(attempt_id: int):
                     score_ru += q.points
 
         res_prog = await session.execute(select(AttemptProg).where(AttemptProg.attempt_id == attempt.id))
-        drafts = res_prog.scalars().all()
-        task_map = {}
-        if drafts:
-            t_ids = [d.task_id for d in drafts]
-            res_t = await session.execute(select(ProgTask).where(ProgTask.id.in_(t_ids)))
-            for t in res_t.scalars().all():
-                task_map[t.id] = t
-
-        for draft in drafts:
-            task = task_map.get(draft.task_id)
-            if not task or not draft.code or not draft.language:
+        task_ids = []
+        for draft in res_prog.scalars().all():
+            if draft.code and draft.language:
+                draft.is_correct = None
+                task_ids.append(draft.task_id)
+            else:
                 draft.is_correct = False
                 draft.verdicts = []
-                continue
+                draft.metrics = []
+
+        attempt.score_total = score_math + score_ru
+        attempt.score_blocks = {"math": score_math, "ru": score_ru}
+        status = attempt.status
+        await session.commit()
+    events.publish(attempt_id, "scored", score_blocks=attempt.score_blocks)
+
+    judge_priority = scheduling.judge_priority(status)
+    finalize = finalize_attempt.si(attempt_id).set(priority=scheduling.grading_priority(status))
+    if task_ids:
+        chord(judge_draft.si(attempt_id, task_id).set(priority=judge_priority) for task_id in task_ids)(finalize)
+    else:
+        finalize.apply_async()
+
+
+async def _judge_attempt_task(attempt_id: int, task_id: int):
+    async with AsyncSessionLocal() as session:
+        res = await session.execute(
+            select(AttemptProg).where(AttemptProg.attempt_id == attempt_id, AttemptProg.task_id == task_id)
+        )
+        draft = res.scalar_one_or_none()
+        res_t = await session.execute(select(ProgTask).where(ProgTask.id == task_id))
+        task = res_t.scalar_one_or_none()
+        if not draft:
+            return
+        if not task or not draft.code or not draft.language:
+            draft.is_correct = False
+            draft.verdicts = []
+            draft.metrics = []
+            await session.commit()
+            events.publish(attempt_id, "task", task_id=task_id, is_correct=False)
+            return
+
+        limits = task_limits(task, draft.language)
+        cache_key = verdict_cache.cache_key(task.id, task.testset_version, draft.language, limits, draft.code)
+        result = verdict_cache.lookup(cache_key)
+        if result is None:
+            res_tc = await session.execute(
+                select(ProgTestcase).where(ProgTestcase.task_id == task.id).order_by(ProgTestcase.id)
+            )
+            rows = res_tc.scalars().all()
+            testcases = _judge_testcases(rows)
+            result = await asyncio.get_running_loop().run_in_executor(
+                _get_judge_executor(),
+                _judge_draft,
+                task.id,
+                task.testset_version,
+                draft.language,
+                draft.code,
+                testcases,
+                limits,
+                cache_key,
+            )
+        else:
+            res_tc = await session.execute(
+                select(ProgTestcase.id, ProgTestcase.input_digest, ProgTestcase.output_digest)
+                .where(ProgTestcase.task_id == task.id)
+                .order_by(ProgTestcase.id)
+            )
+            rows = res_tc.all()
+
+        draft.verdicts, draft.is_correct, draft.metrics = result
+        draft.judged_tests = _judged_tests(rows, limits)
+        await session.commit()
+    events.publish(attempt_id, "task", task_id=task_id, is_correct=draft.is_correct)
+
+
+async def _finalize_attempt(attempt_id: int):
+    async with AsyncSessionLocal() as session:
+        res = await session.execute(select(ExamAttempt).where(ExamAttempt.id == attempt_id))
+        attempt = res.scalar_one_or_none()
+        if not attempt:
+            return
+
+        res_prog = await session.execute(
+            select(ProgTask.points)
+            .join(AttemptProg, AttemptProg.task_id == ProgTask.id)
+            .where(AttemptProg.attempt_id == attempt.id, AttemptProg.is_correct.is_(True))
+        )
+        score_prog = sum(res_prog.scalars().all())
+
+        blocks = dict(attempt.score_blocks or {})
+        blocks["prog"] = score_prog
+        attempt.score_blocks = blocks
+        attempt.score_total = blocks.get("math", 0) + blocks.get("ru", 0) + score_prog
+        await session.commit()
+    events.publish(attempt_id, "graded", score_total=attempt.score_total)
+
+
+def _judge_draft(task_id: int, testset_version: int, language: str, code: str, testcases: list[Testcase],
+                 limits: Limits, cache_key: str):
+    order = ordering.execution_order(task_id, testset_version, testcases)
+    verdicts, all_ok, metrics = run_task_in_sandbox(language, code, ordering.permute(order, testcases), limits)
+    verdicts = ordering.restore(order, verdicts)
+    metrics = ordering.restore(order, metrics)
+    ordering.record(task_id, testset_version, testcases, verdicts, metrics)
+    verdict_cache.store(cache_key, verdicts, all_ok, metrics)
+    return verdicts, all_ok, metrics
+
+
+async def _calibrate_task(task_id: int):
+    async with AsyncSessionLocal() as session:
+        res = await session.execute(select(ProgTask).where(ProgTask.id == task_id))
+        task = res.scalar_one_or_none()
+        if not task or not task.reference_language or not task.reference_code:
+            return
+
+        res_tc = await session.execute(select(ProgTestcase).where(ProgTestcase.task_id == task.id))
+        testcases = _judge_testcases(res_tc.scalars().all())
+        try:
+            result = calibrate(task.reference_language, task.reference_code, testcases)
+        except CalibrationError as exc:
+            task.calibration = {"status": "failed", "error": str(exc)}
+        else:
+            task.limits = result.pop("limits")
+            task.calibration = {"status": "ok", **result}
+        await session.commit()
+
+
+async def _regrade(job_id: str, job):
+    regrade.update(job_id, status="running")
+    try:
+        await job
+    except Exception as exc:
+        regrade.update(job_id, status="failed", error=str(exc))
+        raise
+    regrade.update(job_id, status="done")
+
+
+async def _rescore_attempts(session, attempt_ids) -> None:
+    res_mcq = await session.execute(
+        select(AttemptAnswer.attempt_id, Question.subject, func.sum(Question.points))
+        .join(Question, Question.id == AttemptAnswer.question_id)
+        .where(AttemptAnswer.attempt_id.in_(attempt_ids), AttemptAnswer.is_correct.is_(True))
+        .group_by(AttemptAnswer.attempt_id, Question.subject)
+    )
+    mcq = {(attempt_id, subject): points for attempt_id, subject, points in res_mcq.all()}
+    res_prog = await session.execute(
+        select(AttemptProg.attempt_id, func.sum(ProgTask.points))
+        .join(ProgTask, ProgTask.id == AttemptProg.task_id)
+        .where(AttemptProg.attempt_id.in_(attempt_ids), AttemptProg.is_correct.is_(True))
+        .group_by(AttemptProg.attempt_id)
+    )
+    prog = dict(res_prog.all())
+
+    res = await session.execute(
+        select(ExamAttempt).where(ExamAttempt.id.in_(attempt_ids), ExamAttempt.score_blocks.is_not(None))
+    )
+    for attempt in res.scalars().all():
+        blocks = dict(attempt.score_blocks)
+        blocks["math"] = mcq.get((attempt.id, "math"), 0)
+        blocks["ru"] = mcq.get((attempt.id, "ru"), 0)
+        # Still being judged: finalize_attempt will count the programs.
+        if "prog" in blocks:
+            blocks["prog"] = prog.get(attempt.id, 0)
+        attempt.score_blocks = blocks
+        attempt.score_total = sum(blocks.values())
+
 
-            res_tc = await session.execute(select(ProgTestcase).where(ProgTestcase.task_id == task.id))
-            testcases = res_tc.scalars().all()
-            pairs = [(tc.input_data, tc.output_data) for tc in testcases]
-            verdicts, all_ok = run_task_in_sandbox(draft.language, draft.code, pairs)
-            draft.verdicts = verdicts
-            draft.is_correct = all_ok
-            if all_ok:
-                score_prog += task.points
-
-        attempt.score_total = score_math + score_ru + score_prog
-        attempt.score_blocks = {"math": score_math, "ru": score_ru, "prog": score_prog}
+async def _regrade_question(job_id: str, question_id: int):
+    async with AsyncSessionLocal() as session:
+        res = await session.execute(select(Question).where(Question.id == question_id))
+        question = res.scalar_one_or_none()
+        if not question:
+            raise ValueError(f"Question {question_id} not found")
+
+        is_correct = func.coalesce(AttemptAnswer.selected_index == question.correct_index, False)
+        res = await session.execute(
+            update(AttemptAnswer)
+            .where(
+                AttemptAnswer.question_id == question_id,
+                AttemptAnswer.attempt_id == ExamAttempt.id,
+                ExamAttempt.status != "in_progress",
+                AttemptAnswer.is_correct.is_distinct_from(is_correct),
+            )
+            .values(is_correct=is_correct)
+            .returning(AttemptAnswer.attempt_id)
+            .execution_options(synchronize_session=False)
+        )
+        attempt_ids = set(res.scalars().all())
+        if attempt_ids:
+            await _rescore_attempts(session, attempt_ids)
         await session.commit()
+    count = len(attempt_ids)
+    regrade.update(job_id, total=count, done=count, drafts=count, changed_attempts=count)
+
+
+def _rejudge_program(task_id: int, testset_version: int, language: str, code: str, testcases: list[Testcase],
+                     needed: set[int], limits: Limits, cache_key: str) -> dict[int, tuple[str, dict | None]]:
+    if len(needed) == len(testcases):
+        verdicts, _, metrics = _judge_draft(task_id, testset_version, language, code, testcases, limits, cache_key)
+    else:
+        testcases = [tc for tc in testcases if tc.id in needed]
+        verdicts, _, metrics = run_task_in_sandbox(language, code, testcases, limits)
+    return {tc.id: (verdict, metric) for tc, verdict, metric in zip(testcases, verdicts, metrics)}
+
+
+async def _rejudge_group(task: ProgTask, rows: list[ProgTestcase], drafts: list[AttemptProg]):
+    language, code = drafts[0].language, drafts[0].code
+    limits = task_limits(task, language)
+    cache_key = verdict_cache.cache_key(task.id, task.testset_version, language, limits, code)
+    testcases = _judge_testcases(rows)
+    judged_tests = _judged_tests(rows, limits)
+    fingerprints = dict(judged_tests)
+    reusable = [regrade.reusable_results(draft, fingerprints) for draft in drafts]
+    needed = {
+        tc.id
+        for previous in reusable
+        if not regrade.settled(previous)
+        for tc in testcases
+        if tc.id not in previous
+    }
+    fresh = {}
+    if needed:
+        cached = verdict_cache.lookup(cache_key)
+        if cached is not None:
+            verdicts, _, metrics = cached
+            fresh = {tc.id: (verdict, metric) for tc, verdict, metric in zip(testcases, verdicts, metrics)}
+        else:
+            fresh = await asyncio.get_running_loop().run_in_executor(
+                _get_judge_executor(),
+                _rejudge_program,
+                task.id,
+                task.testset_version,
+                language,
+                code,
+                testcases,
+                needed,
+                limits,
+                cache_key,
+            )
+    return drafts, judged_tests, reusable, fresh
+
+
+async def _regrade_prog_task(job_id: str, task_id: int):
+    async with AsyncSessionLocal() as session:
+        res = await session.execute(select(ProgTask).where(ProgTask.id == task_id))
+        task = res.scalar_one_or_none()
+        if not task:
+            raise ValueError(f"Task {task_id} not found")
+
+        res_tc = await session.execute(
+            select(ProgTestcase).where(ProgTestcase.task_id == task.id).order_by(ProgTestcase.id)
+        )
+        rows = res_tc.scalars().all()
+        testcase_ids = [tc.id for tc in rows]
+        current = {}
+
+        # Drafts still being judged (is_correct IS NULL) are left to their judge_draft job.
+        res = await session.execute(
+            select(AttemptProg)
+            .join(ExamAttempt, ExamAttempt.id == AttemptProg.attempt_id)
+            .where(
+                AttemptProg.task_id == task.id,
+                AttemptProg.is_correct.is_not(None),
+                ExamAttempt.status != "in_progress",
+            )
+        )
+        groups: dict[tuple[str, str], list[AttemptProg]] = {}
+        for draft in res.scalars().all():
+            if not draft.code or not draft.language:
+                continue
+            if draft.language not in current:
+                current[draft.language] = _judged_tests(rows, task_limits(task, draft.language))
+            if draft.judged_tests != current[draft.language]:
+                key = (draft.language, verdict_cache.normalize_code(draft.code))
+                groups.setdefault(key, []).append(draft)
+        regrade.update(job_id, total=len(groups), drafts=sum(len(drafts) for drafts in groups.values()))
+
+        jobs = [_rejudge_group(task, rows, drafts) for drafts in groups.values()]
+        for job in asyncio.as_completed(jobs):
+            drafts, judged_tests, reusable, fresh = await job
+            changed = set()
+            for draft, previous in zip(drafts, reusable):
+                verdicts, is_correct, metrics = regrade.merge(testcase_ids, previous, fresh)
+                if is_correct != draft.is_correct:
+                    changed.add(draft.attempt_id)
+                draft.verdicts, draft.is_correct, draft.metrics = verdicts, is_correct, metrics
+                draft.judged_tests = judged_tests
+            if changed:
+                await _rescore_attempts(session, changed)
+            await session.commit()
+            regrade.advance(job_id, len(changed))
@@ -0,0 +1,57 @@
+"""Startup latency of the docker and process sandbox backends.
+
+Run inside the worker container:
+
+    python -m benchmarks.sandbox_startup --runs 50 --language python
+"""
+
+import argparse
+import statistics
+import time
+
+from app.core.config import settings
+from app.judge.sandbox import get_pool, run_in_sandbox
+
+PROGRAMS = {
+    "python": "print(input())",
+    "node": "console.log(require('fs').readFileSync(0, 'utf8').trim())",
+    "cpp": "#include <iostream>\nint main() { int x; std::cin >> x; std::cout << x << std::endl; }",
+}
+
+
+def measure(backend: str, language: str, runs: int) -> list[float]:
+    settings.judge_backend = backend
+    if backend == "docker":
+        get_pool().warm()
+    status, _, stderr = run_in_sandbox(language, PROGRAMS[language], "1\n")
+    if status != "OK":
+        raise RuntimeError(f"{backend}/{language} warm-up failed: {status} {stderr}")
+
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run_in_sandbox(language, PROGRAMS[language], "1\n")
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--language", choices=sorted(PROGRAMS), default="python")
+    parser.add_argument("--backends", nargs="+", default=["docker", "process"])
+    args = parser.parse_args()
+
+    print(f"{'backend':<10} {'language':<8} {'min':>8} {'p50':>8} {'p95':>8} {'max':>8}  (ms, {args.runs} runs)")
+    for backend in args.backends:
+        samples = sorted(measure(backend, args.language, args.runs))
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(
+            f"{backend:<10} {args.language:<8} {samples[0]:>8.1f} {statistics.median(samples):>8.1f} "
+            f"{p95:>8.1f} {samples[-1]:>8.1f}"
+        )
+    get_pool().shutdown()
+
+
+if __name__ == "__main__":
+    main()
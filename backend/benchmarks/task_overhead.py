@@ -0,0 +1,74 @@
+"""Per-task overhead of running a small DB coroutine from a Celery task.
+
+"per-task" is the old behaviour: asyncio.run() per task, which cannot reuse
+asyncpg connections across loops, so every task opens a fresh connection.
+"persistent" is app.worker.runtime: one loop and one pooled engine per process.
+Run inside the worker container:
+
+    python -m benchmarks.task_overhead --tasks 200
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.db.session import AsyncSessionLocal, make_engine
+from app.models import ExamAttempt
+from app.worker import runtime
+
+
+async def _task(session_factory) -> None:
+    async with session_factory() as session:
+        await session.execute(text("SELECT 1"))
+        await session.execute(select(ExamAttempt.id).limit(1))
+
+
+def per_task(tasks: int) -> list[float]:
+    samples = []
+    for _ in range(tasks):
+        start = time.perf_counter()
+
+        async def run_once():
+            engine = make_engine(poolclass=NullPool)
+            try:
+                await _task(sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False))
+            finally:
+                await engine.dispose()
+
+        asyncio.run(run_once())
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def persistent(tasks: int) -> list[float]:
+    runtime.start()
+    runtime.run(_task(AsyncSessionLocal))
+    samples = []
+    for _ in range(tasks):
+        start = time.perf_counter()
+        runtime.run(_task(AsyncSessionLocal))
+        samples.append((time.perf_counter() - start) * 1000)
+    runtime.stop()
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'mode':<12} {'min':>8} {'p50':>8} {'p95':>8} {'max':>8}  (ms, {args.tasks} tasks)")
+    for name, measure in (("per-task", per_task), ("persistent", persistent)):
+        samples = sorted(measure(args.tasks))
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(f"{name:<12} {samples[0]:>8.1f} {statistics.median(samples):>8.1f} {p95:>8.1f} {samples[-1]:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
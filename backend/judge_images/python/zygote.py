@@ -0,0 +1,240 @@
+# Usage: zygote.py <cpu_ms> <wall_ms> <mem_kb> <output_kb> <first> <count> <fail_fast> <script>
+# Fork-server counterpart of harness.sh for Python submissions. Compiles the
+# script once, imports the standard library modules it imports, then forks one
+# child per test instead of booting a fresh interpreter. Children are limited
+# and measured exactly like judge-run does it, and results.txt gets the same
+# lines as from harness.sh, and fail_fast stops on the same conditions:
+#   "<i> <status> <exit_code> <cpu_ms> <wall_ms> <peak_kb> <sha256 of normalized stdout>"
+import ast
+import atexit
+import builtins
+import gc
+import hashlib
+import os
+import resource
+import signal
+import sys
+import time
+import traceback
+import types
+
+WORKSPACE = "/workspace"
+POLL_INTERVAL = 0.002
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+NOT_PRELOADED = {"antigravity", "this"}
+
+
+def compile_script(path):
+    with open(path, "rb") as f:
+        source = f.read()
+    try:
+        tree = compile(source, path, "exec", ast.PyCF_ONLY_AST, dont_inherit=True)
+        return compile(tree, path, "exec", dont_inherit=True), tree, None
+    except (SyntaxError, ValueError) as exc:
+        return None, None, exc
+
+
+def preload(tree):
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.add(node.module)
+    for name in sorted(names):
+        top = name.split(".")[0]
+        if top not in sys.stdlib_module_names or top in NOT_PRELOADED:
+            continue
+        try:
+            __import__(name)
+        except Exception:  # noqa: BLE001
+            pass
+
+
+def normalize(data):
+    lines = data.replace(b"\r\n", b"\n").split(b"\n")
+    while lines and lines[-1].strip() == b"":
+        lines.pop()
+    return b"\n".join(line.rstrip() for line in lines)
+
+
+def redirect(path, fd, flags):
+    opened = os.open(path, flags, 0o644)
+    os.dup2(opened, fd)
+    os.close(opened)
+
+
+def exit_status(code):
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code & 0xFF
+    print(code, file=sys.stderr)
+    return 1
+
+
+def run_child(code, error, script, cpu_limit, output_limit, input_path):
+    os.setpgid(0, 0)
+    cpu_seconds = cpu_limit // 1000 + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (output_limit, output_limit))
+    redirect(input_path, 0, os.O_RDONLY)
+    redirect(f"{WORKSPACE}/output.txt", 1, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    redirect(f"{WORKSPACE}/err.txt", 2, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    sys.stdin = sys.__stdin__ = open(0, "r", closefd=False)
+    sys.stdout = sys.__stdout__ = open(1, "w", closefd=False)
+    sys.stderr = sys.__stderr__ = open(2, "w", buffering=1, errors="backslashreplace", closefd=False)
+
+    module = types.ModuleType("__main__")
+    module.__file__ = script
+    module.__builtins__ = builtins
+    sys.modules["__main__"] = module
+    sys.argv = [script]
+    sys.path[0] = os.path.dirname(script)
+
+    try:
+        if error is not None:
+            raise error
+        exec(code, module.__dict__)
+        status = 0
+    except SystemExit as exc:
+        status = exit_status(exc.code)
+    except BaseException as exc:  # noqa: BLE001
+        tb = exc.__traceback__.tb_next if error is None else None
+        traceback.print_exception(type(exc), exc, tb)
+        status = 1
+
+    if "threading" in sys.modules:
+        sys.modules["threading"]._shutdown()
+    atexit._run_exitfuncs()
+    try:
+        sys.stdout.flush()
+    except Exception:  # noqa: BLE001
+        status = status or 120
+    try:
+        sys.stderr.flush()
+    except Exception:  # noqa: BLE001
+        pass
+    os._exit(status)
+
+
+def read_cpu_ms(pid):
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            fields = f.read().rsplit(b")", 1)[1].split()
+    except (OSError, IndexError):
+        return 0
+    return (int(fields[11]) + int(fields[12])) * 1000 // CLK_TCK
+
+
+def read_rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status", "rb") as f:
+            for line in f:
+                if line.startswith(b"VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def output_size():
+    try:
+        return os.stat(f"{WORKSPACE}/output.txt").st_size
+    except FileNotFoundError:
+        return 0
+
+
+def run_test(code, error, script, cpu_limit, wall_limit, mem_limit, output_limit, input_path):
+    start = time.monotonic()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_child(code, error, script, cpu_limit, output_limit, input_path)
+        finally:
+            os._exit(1)
+    try:
+        os.setpgid(pid, pid)
+    except OSError:
+        pass
+
+    verdict = None
+    while True:
+        waited, status, usage = os.wait4(pid, os.WNOHANG)
+        if waited == pid:
+            break
+        if verdict is None:
+            if (time.monotonic() - start) * 1000 > wall_limit or read_cpu_ms(pid) > cpu_limit:
+                verdict = "TLE"
+            elif read_rss_kb(pid) > mem_limit:
+                verdict = "MLE"
+            if verdict:
+                kill_group(pid)
+        time.sleep(POLL_INTERVAL)
+    wall_ms = int((time.monotonic() - start) * 1000)
+    kill_group(pid)
+
+    cpu_ms = int(usage.ru_utime * 1000) + int(usage.ru_stime * 1000)
+    peak_kb = usage.ru_maxrss
+    signaled = os.WIFSIGNALED(status)
+    exit_code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else 128 + os.WTERMSIG(status)
+
+    if verdict is None:
+        if peak_kb > mem_limit:
+            verdict = "MLE"
+        elif cpu_ms > cpu_limit or (signaled and os.WTERMSIG(status) == signal.SIGXCPU):
+            verdict = "TLE"
+        elif (signaled and os.WTERMSIG(status) == signal.SIGXFSZ) or output_size() >= output_limit:
+            verdict = "OLE"
+        elif signaled and os.WTERMSIG(status) == signal.SIGKILL:
+            verdict = "MLE"
+        elif exit_code != 0:
+            verdict = "RE"
+        else:
+            verdict = "OK"
+    return verdict, exit_code, cpu_ms, wall_ms, peak_kb
+
+
+def read_file(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return b""
+
+
+def main():
+    cpu_limit, wall_limit, mem_limit, output_kb, first, count = map(int, sys.argv[1:7])
+    fail_fast = sys.argv[7] == "1"
+    script = sys.argv[8]
+
+    code, tree, error = compile_script(script)
+    if tree is not None:
+        preload(tree)
+    gc.collect()
+    gc.freeze()
+
+    with open(f"{WORKSPACE}/results.txt", "a", encoding="utf-8") as results:
+        for index in range(first, first + count):
+            input_path = f"{WORKSPACE}/tests/{index}.in"
+            stats = run_test(code, error, script, cpu_limit, wall_limit, mem_limit, output_kb * 1024, input_path)
+            digest = hashlib.sha256(normalize(read_file(f"{WORKSPACE}/output.txt"))).hexdigest()
+            results.write(f"{index} {' '.join(map(str, stats))} {digest}\n")
+            results.flush()
+            if not fail_fast:
+                continue
+            expected = read_file(f"{WORKSPACE}/tests/{index}.ans").decode().strip()
+            if stats[0] != "OK" or (expected and digest != expected):
+                break
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+/*
+ * judge-run [-u uid] <stats_file> <cpu_ms> <wall_ms> <mem_kb> <output_kb> <program> [args...]
+ *
+ * Runs the program in its own process group with the given CPU, wall clock
+ * and resident memory limits. Files the program writes, stdout included, are
+ * capped at output_kb by RLIMIT_FSIZE. With -u the program runs as that uid
+ * (and gid) with no supplementary groups and no_new_privs, and every process
+ * of that uid still alive when it exits is killed. Then writes one line to
+ * stats_file:
+ *
+ *     <OK|RE|TLE|MLE|OLE|IE> <exit_code> <cpu_ms> <wall_ms> <peak_rss_kb>
+ *
+ * IE means the sandbox could not be set up; the program never ran.
+ * Exits with 0 when the verdict is OK, 1 for other verdicts and 2 for IE.
+ */
+#define _GNU_SOURCE
+#include <errno.h>
+#include <fcntl.h>
+#include <grp.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/prctl.h>
+#include <sys/resource.h>
+#include <sys/stat.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <time.h>
+#include <unistd.h>
+
+#define POLL_INTERVAL_US 2000
+
+static long now_ms(void)
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec * 1000L + ts.tv_nsec / 1000000L;
+}
+
+static long timeval_ms(struct timeval tv)
+{
+    return tv.tv_sec * 1000L + tv.tv_usec / 1000L;
+}
+
+static long read_rss_kb(pid_t pid)
+{
+    char path[64];
+    char line[256];
+    long kb = 0;
+    FILE *f;
+
+    snprintf(path, sizeof(path), "/proc/%d/status", (int)pid);
+    f = fopen(path, "r");
+    if (!f)
+        return 0;
+    while (fgets(line, sizeof(line), f)) {
+        if (strncmp(line, "VmRSS:", 6) == 0) {
+            kb = strtol(line + 6, NULL, 10);
+            break;
+        }
+    }
+    fclose(f);
+    return kb;
+}
+
+static long read_cpu_ms(pid_t pid)
+{
+    char path[64];
+    char buf[1024];
+    unsigned long utime = 0, stime = 0;
+    size_t n;
+    char *p;
+    FILE *f;
+
+    snprintf(path, sizeof(path), "/proc/%d/stat", (int)pid);
+    f = fopen(path, "r");
+    if (!f)
+        return 0;
+    n = fread(buf, 1, sizeof(buf) - 1, f);
+    fclose(f);
+    buf[n] = '\0';
+    p = strrchr(buf, ')');
+    if (!p)
+        return 0;
+    if (sscanf(p + 2, "%*c %*d %*d %*d %*d %*d %*u %*u %*u %*u %*u %lu %lu", &utime, &stime) != 2)
+        return 0;
+    return (long)((utime + stime) * 1000UL / (unsigned long)sysconf(_SC_CLK_TCK));
+}
+
+static int write_stats(const char *path, const char *verdict, int exit_code, long cpu_ms, long wall_ms, long peak_kb)
+{
+    FILE *stats = fopen(path, "w");
+
+    if (!stats) {
+        perror("fopen");
+        return -1;
+    }
+    fprintf(stats, "%s %d %ld %ld %ld\n", verdict, exit_code, cpu_ms, wall_ms, peak_kb);
+    return fclose(stats);
+}
+
+/* Reports a failed setup step to the parent through the close-on-exec pipe. */
+static void setup_failed(int fd, const char *step)
+{
+    char message[128];
+    int len = snprintf(message, sizeof(message), "%s: %s", step, strerror(errno));
+
+    if (write(fd, message, len) < 0)
+        _exit(126);
+    _exit(126);
+}
+
+static void drop_privileges(int fd, uid_t uid)
+{
+    if (setgroups(0, NULL) != 0)
+        setup_failed(fd, "setgroups");
+    if (setgid((gid_t)uid) != 0)
+        setup_failed(fd, "setgid");
+    if (setuid(uid) != 0)
+        setup_failed(fd, "setuid");
+    if (prctl(PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0) != 0)
+        setup_failed(fd, "no_new_privs");
+}
+
+/* Processes the program left behind (daemonized, own process group) die with it. */
+static void kill_uid(uid_t uid)
+{
+    pid_t pid = fork();
+
+    if (pid == 0) {
+        if (setgid((gid_t)uid) == 0 && setuid(uid) == 0)
+            kill(-1, SIGKILL);
+        _exit(0);
+    }
+    if (pid > 0)
+        waitpid(pid, NULL, 0);
+}
+
+int main(int argc, char **argv)
+{
+    const char *stats_path;
+    const char *verdict = NULL;
+    long cpu_limit, wall_limit, mem_limit, output_limit;
+    long start, wall_ms, cpu_ms, peak_kb;
+    long uid = -1;
+    int status = 0;
+    int exit_code;
+    int setup_pipe[2];
+    char setup_error[256];
+    ssize_t n;
+    struct rusage usage;
+    struct stat out;
+    pid_t pid;
+    int opt;
+
+    while ((opt = getopt(argc, argv, "+u:")) != -1) {
+        switch (opt) {
+        case 'u':
+            uid = atol(optarg);
+            break;
+        default:
+            return 2;
+        }
+    }
+    argc -= optind;
+    argv += optind;
+    if (argc < 6 || uid == 0) {
+        fprintf(stderr, "usage: judge-run [-u uid] <stats_file> <cpu_ms> <wall_ms> <mem_kb> <output_kb> <program> [args...]\n");
+        return 2;
+    }
+    stats_path = argv[0];
+    cpu_limit = atol(argv[1]);
+    wall_limit = atol(argv[2]);
+    mem_limit = atol(argv[3]);
+    output_limit = atol(argv[4]) * 1024L;
+
+    if (pipe2(setup_pipe, O_CLOEXEC) != 0) {
+        perror("pipe2");
+        write_stats(stats_path, "IE", 0, 0, 0, 0);
+        return 2;
+    }
+    pid = fork();
+    if (pid < 0) {
+        perror("fork");
+        write_stats(stats_path, "IE", 0, 0, 0, 0);
+        return 2;
+    }
+    if (pid == 0) {
+        struct rlimit cpu = {(rlim_t)(cpu_limit / 1000 + 1), (rlim_t)(cpu_limit / 1000 + 2)};
+        struct rlimit core = {0, 0};
+        struct rlimit fsize = {(rlim_t)output_limit, (rlim_t)output_limit};
+
+        close(setup_pipe[0]);
+        setpgid(0, 0);
+        if (setrlimit(RLIMIT_CPU, &cpu) != 0 || setrlimit(RLIMIT_CORE, &core) != 0 ||
+            setrlimit(RLIMIT_FSIZE, &fsize) != 0)
+            setup_failed(setup_pipe[1], "setrlimit");
+        if (uid > 0)
+            drop_privileges(setup_pipe[1], (uid_t)uid);
+        execvp(argv[5], argv + 5);
+        perror("execvp");
+        _exit(127);
+    }
+    setpgid(pid, pid);
+
+    /* EOF once the program is exec'd; a message if a setup step failed. */
+    close(setup_pipe[1]);
+    do {
+        n = read(setup_pipe[0], setup_error, sizeof(setup_error) - 1);
+    } while (n < 0 && errno == EINTR);
+    close(setup_pipe[0]);
+    if (n != 0) {
+        setup_error[n > 0 ? n : 0] = '\0';
+        fprintf(stderr, "judge-run: %s\n", n > 0 ? setup_error : "setup pipe failed");
+        kill(-pid, SIGKILL);
+        waitpid(pid, NULL, 0);
+        write_stats(stats_path, "IE", 0, 0, 0, 0);
+        return 2;
+    }
+    start = now_ms();
+
+    memset(&usage, 0, sizeof(usage));
+    for (;;) {
+        pid_t r = wait4(pid, &status, WNOHANG, &usage);
+        if (r == pid)
+            break;
+        if (r < 0 && errno != EINTR) {
+            perror("wait4");
+            return 2;
+        }
+        if (!verdict) {
+            if (now_ms() - start > wall_limit || read_cpu_ms(pid) > cpu_limit)
+                verdict = "TLE";
+            else if (read_rss_kb(pid) > mem_limit)
+                verdict = "MLE";
+            if (verdict)
+                kill(-pid, SIGKILL);
+        }
+        usleep(POLL_INTERVAL_US);
+    }
+    wall_ms = now_ms() - start;
+    kill(-pid, SIGKILL);
+    if (uid > 0)
+        kill_uid((uid_t)uid);
+
+    cpu_ms = timeval_ms(usage.ru_utime) + timeval_ms(usage.ru_stime);
+    peak_kb = usage.ru_maxrss;
+    exit_code = WIFEXITED(status) ? WEXITSTATUS(status) : 128 + WTERMSIG(status);
+
+    if (!verdict) {
+        if (peak_kb > mem_limit)
+            verdict = "MLE";
+        else if (cpu_ms > cpu_limit || (WIFSIGNALED(status) && WTERMSIG(status) == SIGXCPU))
+            verdict = "TLE";
+        else if ((WIFSIGNALED(status) && WTERMSIG(status) == SIGXFSZ) ||
+                 (fstat(STDOUT_FILENO, &out) == 0 && S_ISREG(out.st_mode) && out.st_size >= output_limit))
+            verdict = "OLE";
+        else if (WIFSIGNALED(status) && WTERMSIG(status) == SIGKILL)
+            /* Killed from outside the process: the container's OOM killer. */
+            verdict = "MLE";
+        else if (exit_code != 0)
+            verdict = "RE";
+        else
+            verdict = "OK";
+    }
+
+    if (write_stats(stats_path, verdict, exit_code, cpu_ms, wall_ms, peak_kb) != 0)
+        return 2;
+    return strcmp(verdict, "OK") == 0 ? 0 : 1;
+}
@@ -3,4 +3,4 @@ set -e
 
 python -m app.judge.build_images
 
-exec celery -A app.worker.celery_app worker -l info
+exec celery -A app.worker.celery_app worker -l info -Q "${CELERY_QUEUES:-grading,judge}"
@@ -8,6 +8,15 @@ export function setToken(token: string) {
   localStorage.setItem('token', token)
 }
 
+export class ApiError extends Error {
+  status: number
+
+  constructor(status: number, message: string) {
+    super(message)
+    this.status = status
+  }
+}
+
 export async function apiFetch(path: string, options: RequestInit = {}) {
   const token = getToken()
   const headers: Record<string, string> = {
@@ -18,8 +27,14 @@ export async function apiFetch(path: string, options: RequestInit = {}) {
   const res = await fetch(`${API_URL}${path}`, { ...options, headers })
   if (!res.ok) {
     const text = await res.text()
-    throw new Error(text || res.statusText)
+    throw new ApiError(res.status, text || res.statusText)
   }
   if (res.status === 204) return null
   return res.json()
 }
+
+export function apiEvents(path: string) {
+  const token = getToken()
+  const query = token ? `?token=${encodeURIComponent(token)}` : ''
+  return new EventSource(`${API_URL}${path}${query}`)
+}
@@ -1,7 +1,7 @@
 import { useEffect, useRef, useState } from 'react'
 import { useNavigate } from 'react-router-dom'
 import Editor from '@monaco-editor/react'
-import { apiFetch } from '../api/client'
+import { ApiError, apiFetch } from '../api/client'
 import '../styles/exam.css'
 
 type ExamState = {
@@ -13,7 +13,20 @@ type ExamState = {
   ru_questions: any[]
   prog_tasks: any[]
   answers: Record<string, number | null>
-  drafts: Record<string, { language: string, code: string }>
+  drafts: Record<string, { language: string, code: string, version?: number }>
+}
+
+type DraftEdit = { start: number, end: number, text: string }
+
+// A single replacement covering everything between the common prefix and suffix.
+function diffEdits(base: string, code: string): DraftEdit[] {
+  if (base === code) return []
+  let start = 0
+  while (start < base.length && start < code.length && base[start] === code[start]) start++
+  let end = 0
+  while (end < base.length - start && end < code.length - start
+    && base[base.length - 1 - end] === code[code.length - 1 - end]) end++
+  return [{ start, end: base.length - end, text: code.slice(start, code.length - end) }]
 }
 
 export default function ExamPage() {
@@ -27,10 +40,19 @@ export default function ExamPage() {
   const [error, setError] = useState('')
   const navigate = useNavigate()
   const saveTimers = useRef<Record<string, any>>({})
+  // Last code the server acknowledged per task, the base that edits are computed against.
+  const synced = useRef<Record<string, { version: number, code: string }>>({})
+
+  function trackDrafts(data: ExamState) {
+    for (const [taskId, draft] of Object.entries(data.drafts || {})) {
+      if (draft.version !== undefined) synced.current[taskId] = { version: draft.version, code: draft.code || '' }
+    }
+  }
 
   async function loadState() {
     try {
       const data = await apiFetch('/exam/state')
+      trackDrafts(data)
       setState(data)
     } catch (e: any) {
       setState(null)
@@ -66,6 +88,7 @@ export default function ExamPage() {
 
   async function startExam() {
     const data = await apiFetch('/exam/start', { method: 'POST' })
+    trackDrafts(data)
     setState(data)
   }
 
@@ -103,10 +126,20 @@ export default function ExamPage() {
       drafts: { ...state.drafts, [taskId]: { language, code } }
     })
     scheduleSave(`t_${taskId}`, async () => {
-      await apiFetch(`/exam/draft/${taskId}`, {
-        method: 'PUT',
-        body: JSON.stringify({ language, code })
-      })
+      const put = (body: object) => apiFetch(`/exam/draft/${taskId}`, { method: 'PUT', body: JSON.stringify(body) })
+      const base = synced.current[taskId]
+      let res
+      try {
+        res = await put(base
+          ? { language, base_version: base.version, edits: diffEdits(base.code, code) }
+          : { language, code })
+      } catch (e: any) {
+        if (!(e instanceof ApiError) || e.status !== 409) throw e
+        // Changed elsewhere (another tab): what is in this editor wins.
+        const server = JSON.parse(e.message).detail?.draft
+        res = await put({ language, code, base_version: server?.version ?? 0 })
+      }
+      synced.current[taskId] = { version: res.version, code }
     })
   }
 
@@ -1,6 +1,6 @@
-import { useEffect, useRef, useState } from 'react'
+import { useEffect, useState } from 'react'
 import { useNavigate } from 'react-router-dom'
-import { apiFetch } from '../api/client'
+import { apiEvents, apiFetch } from '../api/client'
 import '../styles/result.css'
 
 type Result = {
@@ -9,43 +9,67 @@ type Result = {
   score_total: number
   score_blocks: Record<string, number>
   per_question: Record<string, boolean>
-  per_task: Record<string, boolean>
+  per_task: Record<string, boolean | null>
+  pending_blocks: string[]
 }
 
+const PENDING_TEXT = 'Проверяется...'
+
 export default function ResultPage() {
   const [result, setResult] = useState<Result | null>(null)
   const [state, setState] = useState<any>(null)
   const [loadingText, setLoadingText] = useState('Идет проверка решений...')
-  const timerRef = useRef<number | null>(null)
   const navigate = useNavigate()
 
   useEffect(() => {
     let active = true
+    let events: EventSource | null = null
 
-    async function loadOnce() {
+    async function loadResult() {
       try {
         const r = await apiFetch('/exam/result')
-        const s = await apiFetch('/exam/state')
         if (!active) return
         setResult(r)
-        setState(s)
         setLoadingText('')
-        if (timerRef.current) {
-          clearInterval(timerRef.current)
-          timerRef.current = null
-        }
+        if (r.pending_blocks.length === 0) events?.close()
+      } catch (_e) {
+        if (active) setLoadingText('Идет проверка решений... Обновляем автоматически.')
+      }
+    }
+
+    async function loadOnce() {
+      try {
+        const s = await apiFetch('/exam/state')
+        if (active) setState(s)
       } catch (_e) {
         if (active) setLoadingText('Идет проверка решений... Обновляем автоматически.')
       }
+      await loadResult()
     }
 
+    // The server pushes an event whenever a block or a task is graded; the page re-reads the result only then.
+    let opened = false
+    events = apiEvents('/exam/events')
+    events.onopen = () => {
+      // Events sent while the browser was reconnecting are lost.
+      if (opened) loadResult()
+      opened = true
+    }
+    events.addEventListener('scored', loadResult)
+    events.addEventListener('resync', loadResult)
+    events.addEventListener('task', (e) => {
+      const data = JSON.parse((e as MessageEvent).data)
+      setResult((r) => (r ? { ...r, per_task: { ...r.per_task, [data.task_id]: data.is_correct } } : r))
+    })
+    events.addEventListener('graded', () => {
+      events?.close()
+      loadResult()
+    })
     loadOnce()
-    timerRef.current = window.setInterval(loadOnce, 2000)
 
     return () => {
       active = false
-      if (timerRef.current) clearInterval(timerRef.current)
-      timerRef.current = null
+      events?.close()
     }
   }, [])
 
@@ -56,22 +80,26 @@ export default function ResultPage() {
 
   if (!result || !state) return <div className="result-page"><div className="wait-box">{loadingText}</div></div>
 
+  function blockScore(block: string) {
+    return result!.pending_blocks.includes(block) ? PENDING_TEXT : result!.score_blocks[block] || 0
+  }
+
   return (
     <div className="result-page">
       <h2>Результаты экзамена</h2>
       <div className="summary">
         <div className="score-card total">Общий балл: {result.score_total}</div>
-        <div className="score-card">Информатика: {result.score_blocks.prog || 0}</div>
-        <div className="score-card">Математика: {result.score_blocks.math || 0}</div>
-        <div className="score-card">Русский: {result.score_blocks.ru || 0}</div>
+        <div className="score-card">Информатика: {blockScore('prog')}</div>
+        <div className="score-card">Математика: {blockScore('math')}</div>
+        <div className="score-card">Русский: {blockScore('ru')}</div>
       </div>
 
       <div className="section">
         <h3>Информатика</h3>
         {state.prog_tasks.map((t: any, i: number) => (
-          <div key={t.id} className={`row ${result.per_task[t.id] ? 'ok' : 'wa'}`}>
+          <div key={t.id} className={`row ${result.per_task[t.id] === null ? '' : result.per_task[t.id] ? 'ok' : 'wa'}`}>
             <span>Задача {i + 1}: {t.title}</span>
-            <b>{result.per_task[t.id] ? 'Верно' : 'Неверно'}</b>
+            <b>{result.per_task[t.id] === null ? PENDING_TEXT : result.per_task[t.id] ? 'Верно' : 'Неверно'}</b>
           </div>
         ))}
       </div>